@@ -0,0 +1,125 @@
+# 批量生成印章命令行工具
+#
+# 用法：
+#   python batch.py specs.csv -o out_dir
+#   python batch.py specs.jsonl -o seals.zip --workers 8 --unordered --key private.pem
+#
+# 输入文件为CSV（带表头）或JSONL，每条记录包含字段：
+#   company_name  单位名称（必填）
+#   bottom_text   底部文字
+#   size          印章尺寸，默认400
+#   document      待签名文件路径（可选，相对路径以输入文件所在目录为准）
+# 输出目录或zip文件中包含每个印章的PNG图片和逐条结果报告report.jsonl
+import argparse
+import csv
+import json
+import os
+import sys
+import zipfile
+
+from cryptography.hazmat.primitives import serialization
+
+from seal_core import SealGenerator
+
+
+def read_specs(path):
+    """逐条读取CSV或JSONL格式的印章参数"""
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if path.lower().endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            document = row.get("document")
+            if document and not os.path.isabs(document):
+                row["document"] = os.path.join(base_dir, document)
+            yield row
+
+
+class DirWriter:
+    """把结果写入目录"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, name, data):
+        # 名称来自输入（如zip成员名），不允许写到输出目录之外
+        root = os.path.realpath(self.path)
+        path = os.path.realpath(os.path.join(root, name))
+        if os.path.commonpath([root, path]) != root:
+            raise ValueError(f"输出路径超出目录 {self.path}: {name}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def close(self):
+        pass
+
+
+class ZipWriter:
+    """把结果逐个写入zip文件（PNG已压缩，直接存储）"""
+
+    def __init__(self, path):
+        self.zip = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED)
+
+    def write(self, name, data):
+        self.zip.writestr(name, data)
+
+    def close(self):
+        self.zip.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量生成红章")
+    parser.add_argument("specs", help="印章参数文件，CSV或JSONL")
+    parser.add_argument("-o", "--output", required=True, help="输出目录，或以.zip结尾的zip文件")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="进程数，默认CPU核数")
+    parser.add_argument("--hash-workers", type=int, default=4, help="并发计算待签名文件哈希的线程数，0表示由绘制进程各自计算")
+    parser.add_argument("--unordered", action="store_true", help="按完成先后输出，不保持输入顺序")
+    parser.add_argument("--key", help="PEM格式私钥文件，不指定时生成新密钥")
+    args = parser.parse_args(argv)
+
+    if args.key:
+        with open(args.key, "rb") as f:
+            generator = SealGenerator(serialization.load_pem_private_key(f.read(), password=None))
+    else:
+        generator = SealGenerator()
+
+    if args.output.lower().endswith(".zip"):
+        writer = ZipWriter(args.output)
+    else:
+        writer = DirWriter(args.output)
+
+    report = []
+    failed = 0
+    try:
+        results = generator.create_seals(read_specs(args.specs), workers=args.workers,
+                                         ordered=not args.unordered, image_format="PNG",
+                                         hash_workers=args.hash_workers)
+        for result in results:
+            entry = {
+                "index": result["index"],
+                "company_name": result["spec"].get("company_name"),
+                "file": None,
+                "watermark_data": result["watermark_data"],
+                "error": result["error"],
+            }
+            if result["error"]:
+                failed += 1
+                print(f"[{result['index']}] 失败: {result['error']}", file=sys.stderr)
+            else:
+                entry["file"] = f"{result['index']:06d}.png"
+                writer.write(entry["file"], result["data"])
+            report.append(json.dumps(entry, ensure_ascii=False))
+        writer.write("report.jsonl", ("\n".join(report) + "\n").encode())
+    finally:
+        writer.close()
+
+    print(f"完成：成功 {len(report) - failed}，失败 {failed}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
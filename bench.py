@@ -0,0 +1,277 @@
+# 性能基准测试
+#
+# 用法：
+#   python bench.py                                  # 运行全部用例并打印结果
+#   python bench.py -o results.json                  # 保存结果
+#   python bench.py --save-baseline baseline.json    # 保存为基线
+#   python bench.py --baseline baseline.json --threshold 0.2   # 与基线比较，中位数变慢超过20%时返回非0
+#   python bench.py -k draw_stamp -n 10              # 只运行名称包含draw_stamp的用例，每个重复10次
+#
+# 每个用例先预热一次，再重复计时，报告耗时（最小/中位数/平均，毫秒）、运行期间的峰值RSS增量，
+# 以及tracemalloc统计的Python层内存分配峰值和分配次数（Pillow内部的图像内存不在统计范围内）
+import argparse
+import atexit
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # Windows没有resource模块
+    resource = None
+
+from PIL import Image, ImageFilter
+
+import app
+
+SIZES = (200, 300, 400)
+TEXT_LENGTHS = (4, 8, 14)
+DEFAULT_CHARS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def _rss_kb():
+    """读取当前进程的RSS（KB），非Linux系统返回None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class RssSampler:
+    """在后台线程中定时采样RSS，记录运行期间的峰值"""
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start = _rss_kb()
+        self.peak = self.start
+        if self.start is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = _rss_kb()
+            if rss > self.peak:
+                self.peak = rss
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self.peak = max(self.peak, _rss_kb())
+
+    @property
+    def delta(self):
+        return None if self.start is None else self.peak - self.start
+
+
+class Case:
+    """一个基准用例：setup() 返回传给 fn 的参数，每次计时前都会调用，不计入耗时"""
+
+    def __init__(self, name, fn, setup=None, repeat=None):
+        self.name = name
+        self.fn = fn
+        self.setup = setup or (lambda: ())
+        self.repeat = repeat
+
+    def run(self, repeat):
+        repeat = self.repeat or repeat
+        self.fn(*self.setup())
+
+        times = []
+        with RssSampler() as rss:
+            for _ in range(repeat):
+                args = self.setup()
+                gc.collect()
+                start = time.perf_counter()
+                self.fn(*args)
+                times.append((time.perf_counter() - start) * 1000)
+
+        # 内存分配单独统计一次，避免tracemalloc影响计时
+        args = self.setup()
+        gc.collect()
+        tracemalloc.start()
+        self.fn(*args)
+        alloc_size, alloc_peak = tracemalloc.get_traced_memory()
+        alloc_count = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+        tracemalloc.stop()
+
+        return {
+            "name": self.name,
+            "repeat": repeat,
+            "min_ms": min(times),
+            "median_ms": statistics.median(times),
+            "mean_ms": statistics.fmean(times),
+            "peak_rss_delta_kb": rss.delta,
+            "alloc_peak_kb": alloc_peak // 1024,
+            "alloc_blocks": alloc_count,
+        }
+
+
+def _text(chars, length):
+    return (chars * (length // len(chars) + 1))[:length]
+
+
+def _stamp(size, text):
+    """构造与 SealGenerator.create_seal 相同参数的Stamp"""
+    return app.Stamp(
+        R=int(size * 0.65), H=int(size * 0.25), r=int(size * 0.25),
+        edge=int(size * 0.04), border=int(size * 0.04), fill=(220, 20, 20, 180),
+        words_up=text, words_mid="", words_down="1234567890", angle_up=270, angle_down=60,
+        font_size_up=int(size * 0.2), font_size_down=int(size * 0.1), save_path="temp.png")
+
+
+def _no_cache():
+    app.glyph_cache.clear()
+    app.seal_cache.clear()
+    app.stamp_layout.cache_clear()
+    return ()
+
+
+def _cold_stamp(size, words):
+    _no_cache()
+    return (_stamp(size, words),)
+
+
+def build_cases(chars):
+    cases = []
+    text = _text(chars, 14)
+    generator = app.SealGenerator()
+    payload = b"RSW\x01" + b"x" * 600
+
+    # 整个印章的绘制（冷缓存），覆盖不同尺寸和文字长度
+    for size in SIZES:
+        for length in TEXT_LENGTHS:
+            words = _text(chars, length)
+            cases.append(Case(f"draw_stamp[size={size},len={length}]", lambda stamp: stamp.draw_stamp(),
+                              lambda size=size, words=words: _cold_stamp(size, words)))
+    cases.append(Case("draw_stamp_warm[size=400,len=14]", lambda stamp: stamp.draw_stamp(),
+                      lambda: (_stamp(400, text),)))
+
+    # 版式计算（文字位置、角度和外框）
+    for length in TEXT_LENGTHS:
+        stamp = _stamp(400, _text(chars, length))
+        cases.append(Case(f"stamp_layout[len={length}]",
+                          lambda params=stamp.layout_params(): app.StampLayout.build(params)))
+
+    # 单个字的旋转绘制
+    for size in SIZES:
+        stamp = _stamp(size, text)
+        center = stamp.R + stamp.edge
+        canvas = Image.new("RGBA", (2 * center, 2 * center), (255, 255, 255, 0))
+        cases.append(Case(f"draw_rotated_text[size={size}]",
+                          lambda stamp=stamp, canvas=canvas, center=center: stamp.draw_rotated_text(
+                              canvas, 37.5, (center, center), stamp.R - stamp.border * 2, chars[0], stamp.fill,
+                              stamp.font_size_up, stamp.font_xratio_up, stamp.stroke_width_up),
+                          _no_cache))
+
+    for size in SIZES:
+        stamp = _stamp(size, text)
+        stamp.draw_stamp()
+        seal = stamp.img
+        cases.append(Case(f"gaussian_blur[size={size}]", lambda img: img.filter(ImageFilter.GaussianBlur(0.6)),
+                          lambda seal=seal: (seal,)))
+        cases.append(Case(f"embed_watermark[size={size}]",
+                          lambda img: generator._embed_watermark_bytes(img, payload),
+                          lambda seal=seal: (seal.copy(),)))
+
+        signed = generator.add_watermark(seal.copy(), {"issuer": text, "timestamp": "2025-08-20",
+                                                       "file_hash": "0" * 64, "file_size": 1024})
+        buf = io.BytesIO()
+        signed.save(buf, format="PNG")
+        png = buf.getvalue()
+        cases.append(Case(f"extract_watermark[size={size}]", app.extract_watermark_bytes, lambda signed=signed: (signed,)))
+        cases.append(Case(f"verify_seal_file[size={size}]", app.verify_seal_file, lambda png=png: (png,)))
+
+    # 端到端：进程内生成（冷缓存）和经过生成后端的界面函数（后端工作进程中的缓存不会被清空）
+    document = tempfile.NamedTemporaryFile(suffix=".txt", delete=False)
+    document.write(os.urandom(64 * 1024))
+    document.close()
+    atexit.register(os.remove, document.name)
+    for size in SIZES:
+        cases.append(Case(f"generate_seal[size={size}]",
+                          lambda size=size: app.generate_seal(text, "1234567890", size, True, document.name, None),
+                          _no_cache))
+    cases.append(Case("generate_seal_interface[size=400]",
+                      lambda: app.generate_seal_interface(text, "1234567890", "400", True, document.name, None),
+                      _no_cache))
+    return cases
+
+
+def compare(results, baseline, threshold):
+    """与基线比较中位数耗时，返回变慢超过阈值的用例"""
+    base = {item["name"]: item for item in baseline["results"]}
+    regressions = []
+    for item in results:
+        old = base.get(item["name"])
+        if not old or not old["median_ms"]:
+            continue
+        ratio = item["median_ms"] / old["median_ms"]
+        item["baseline_median_ms"] = old["median_ms"]
+        item["ratio"] = ratio
+        if ratio > 1 + threshold:
+            regressions.append(item)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="印章生成与验证性能基准")
+    parser.add_argument("-n", "--repeat", type=int, default=5, help="每个用例的计时次数")
+    parser.add_argument("-k", "--filter", help="只运行名称包含该字符串的用例")
+    parser.add_argument("--chars", default=DEFAULT_CHARS, help="印章文字使用的字符，需有对应字体")
+    parser.add_argument("-o", "--output", help="结果JSON文件")
+    parser.add_argument("--save-baseline", help="把本次结果保存为基线文件")
+    parser.add_argument("--baseline", help="用于比较的基线文件")
+    parser.add_argument("--threshold", type=float, default=0.2, help="中位数耗时超过基线的比例阈值")
+    args = parser.parse_args(argv)
+
+    cases = [case for case in build_cases(args.chars) if not args.filter or args.filter in case.name]
+    results = []
+    for case in cases:
+        result = case.run(args.repeat)
+        results.append(result)
+        print(f"{result['name']:<40} median {result['median_ms']:9.3f} ms  min {result['min_ms']:9.3f} ms  "
+              f"rss +{result['peak_rss_delta_kb']} KB  alloc {result['alloc_peak_kb']} KB", file=sys.stderr)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "pillow": Image.__version__,
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+        "results": results,
+    }
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for item in regressions:
+            print(f"性能退化: {item['name']} {item['baseline_median_ms']:.3f} ms -> {item['median_ms']:.3f} ms "
+                  f"({item['ratio']:.2f}x)", file=sys.stderr)
+        status = 1 if regressions else 0
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
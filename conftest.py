@@ -0,0 +1 @@
+# 测试从仓库根目录导入seal_core
@@ -0,0 +1,44 @@
+# 红章生成与验证的核心包：印章绘制、数字签名、水印嵌入与验证、批量处理和性能指标
+# 不依赖gradio，命令行工具和进程池的工作进程只导入本包；界面见app.py
+# monitoring  各阶段耗时统计
+# fonts       字体加载、字形缓存和轮廓解析
+# png         PNG编码与PNG模板
+# watermark   水印格式、嵌入提取和签名验证
+# render      印章排版与绘制（栅格、SVG、PDF）和印章缓存
+# generator   SealGenerator、签名密钥缓存和批量生成
+# service     界面使用的生成后端、临时目录、实时预览和指标服务
+# pipelines   批量验证和批量签名
+from .monitoring import Metrics, metrics
+from .fonts import FontOutlines, GlyphCache, font_outlines, font_path, glyph_cache, is_Chinese, load_font
+from .png import PNG_OPTIONS, PNG_SIGNATURE, PngTemplate, encode_image
+from .watermark import (HASH_CHUNK_SIZE, WATERMARK_BINARY_HEAD, WATERMARK_HEADER_PIXELS, WATERMARK_KEY_P256,
+                        WATERMARK_MAGIC, WATERMARK_PROBE_PIXELS, WATERMARK_VERSION_BINARY, WATERMARK_VERSION_JSON,
+                        WATERMARK_VERSION_LEGACY, check_watermark_header, decode_watermark, embed_watermark_array,
+                        extract_watermark_bytes, file_watermark_data, hash_file, hash_stream,
+                        is_binary_watermark_data, load_point_public_key, load_public_key, make_watermark_data,
+                        probe_watermark, verify_seal, verify_seal_file, watermark_capacity, watermark_pixels)
+from .render import SealCache, Stamp, StampLayout, circle, pentagram, seal_cache, stamp_layout
+from .generator import KeyRegistry, SealGenerator, key_registry, pool_context
+from .service import (BackendBusy, PreviewRenderer, RenderBackend, ScratchDir, generate_seal, preview_renderer,
+                      prometheus_metrics, render_backend, scratch_dir, start_metrics_server)
+from .pipelines import (SEAL_IMAGE_EXTENSIONS, DocumentSigner, document_name, iter_documents, iter_seal_images,
+                        sign_documents, verify_seals)
+
+# from seal_core import * 只导出以上公开接口，不导出各模块导入的numpy、PIL等
+__all__ = [
+    "Metrics", "metrics",
+    "FontOutlines", "GlyphCache", "font_outlines", "font_path", "glyph_cache", "is_Chinese", "load_font",
+    "PNG_OPTIONS", "PNG_SIGNATURE", "PngTemplate", "encode_image",
+    "HASH_CHUNK_SIZE", "WATERMARK_BINARY_HEAD", "WATERMARK_HEADER_PIXELS", "WATERMARK_KEY_P256", "WATERMARK_MAGIC",
+    "WATERMARK_PROBE_PIXELS", "WATERMARK_VERSION_BINARY", "WATERMARK_VERSION_JSON", "WATERMARK_VERSION_LEGACY",
+    "check_watermark_header", "decode_watermark", "embed_watermark_array", "extract_watermark_bytes",
+    "file_watermark_data", "hash_file", "hash_stream", "is_binary_watermark_data", "load_point_public_key",
+    "load_public_key", "make_watermark_data", "probe_watermark", "verify_seal", "verify_seal_file",
+    "watermark_capacity", "watermark_pixels",
+    "SealCache", "Stamp", "StampLayout", "circle", "pentagram", "seal_cache", "stamp_layout",
+    "KeyRegistry", "SealGenerator", "key_registry", "pool_context",
+    "BackendBusy", "PreviewRenderer", "RenderBackend", "ScratchDir", "generate_seal", "preview_renderer",
+    "prometheus_metrics", "render_backend", "scratch_dir", "start_metrics_server",
+    "SEAL_IMAGE_EXTENSIONS", "DocumentSigner", "document_name", "iter_documents", "iter_seal_images",
+    "sign_documents", "verify_seals",
+]
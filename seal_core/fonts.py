@@ -0,0 +1,322 @@
+# 字体加载、字形缓存和TrueType轮廓解析
+import os
+import struct
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+# type: ignore
+from PIL import ImageFont
+
+from .monitoring import metrics
+
+# 判断字符是否为中文
+def is_Chinese(ch):
+    if '\u4e00' <= ch <= '\u9fff':
+        return True
+    return False
+
+# 字体文件路径，优先使用程序目录（本包的上级目录）下的字体文件，不依赖当前工作目录
+def font_path(font_file):
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), font_file)
+    if not os.path.exists(path):
+        path = font_file
+    return path
+
+# 加载字体
+def load_font(font_file, font_size):
+    with metrics.stage("font_load"):
+        return ImageFont.truetype(font_path(font_file), font_size, encoding="utf-8")
+
+class GlyphCache:
+    """
+        进程内共享的字体与字形图块缓存
+        字体对象按 (字体文件, 字号) 缓存；旋转后的字形图块按绘制参数缓存，总内存超出 max_bytes 时按LRU淘汰
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_fonts=64):
+        self.max_bytes = max_bytes  # 字形图块的内存预算（字节）
+        self.max_fonts = max_fonts  # 最多缓存的字体对象个数
+        self._fonts = OrderedDict()
+        self._glyphs = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.font_hits = 0
+        self.font_misses = 0
+        self.evictions = 0
+
+    def get_font(self, font_file, font_size):
+        """获取字体对象，同一字体文件和字号只解析一次"""
+        key = (font_file, font_size)
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is not None:
+                self._fonts.move_to_end(key)
+                self.font_hits += 1
+                return font
+            self.font_misses += 1
+
+        font = load_font(font_file, font_size)
+        with self._lock:
+            self._fonts[key] = font
+            while len(self._fonts) > self.max_fonts:
+                self._fonts.popitem(last=False)
+        return font
+
+    def get_glyph(self, key):
+        """查找已旋转的字形图块，未命中返回None"""
+        with self._lock:
+            glyph = self._glyphs.get(key)
+            if glyph is None:
+                self.misses += 1
+                return None
+            self._glyphs.move_to_end(key)
+            self.hits += 1
+            return glyph
+
+    def put_glyph(self, key, glyph):
+        """缓存字形图块 (mask, offset)，超出内存预算时淘汰最久未使用的图块"""
+        size = glyph[0].size[0] * glyph[0].size[1]
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._glyphs.pop(key, None)
+            if old is not None:
+                self._bytes -= old[0].size[0] * old[0].size[1]
+            self._glyphs[key] = glyph
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._glyphs.popitem(last=False)
+                self._bytes -= evicted[0].size[0] * evicted[0].size[1]
+                self.evictions += 1
+
+    def clear(self):
+        """清空缓存和统计"""
+        with self._lock:
+            self._fonts.clear()
+            self._glyphs.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.font_hits = self.font_misses = self.evictions = 0
+
+    def stats(self):
+        """返回命中率和内存占用统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "font_hits": self.font_hits,
+                "font_misses": self.font_misses,
+                "evictions": self.evictions,
+                "glyphs": len(self._glyphs),
+                "fonts": len(self._fonts),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+# 全局共享的字形缓存，所有Stamp实例默认使用
+glyph_cache = GlyphCache()
+
+class FontOutlines:
+    """
+        读取TrueType字体（.ttf或.ttc中的第一个字体）中的字形轮廓，用于矢量输出
+        轮廓为字体单位（y轴向上）的路径段列表：("M", x, y)、("L", x, y)、("Q", cx, cy, x, y)、("Z",)
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.data = data = f.read()
+        base = 0
+        if data[:4] == b"ttcf":
+            base = struct.unpack_from(">I", data, 12)[0]
+        num_tables = struct.unpack_from(">H", data, base + 4)[0]
+        self.tables = {}
+        for i in range(num_tables):
+            tag, _, offset, length = struct.unpack_from(">4sIII", data, base + 12 + 16 * i)
+            self.tables[tag.decode("latin-1")] = (offset, length)
+
+        head = self.tables["head"][0]
+        self.units_per_em = struct.unpack_from(">H", data, head + 18)[0]
+        loca_format = struct.unpack_from(">h", data, head + 50)[0]
+        num_glyphs = struct.unpack_from(">H", data, self.tables["maxp"][0] + 4)[0]
+        loca = self.tables["loca"][0]
+        if loca_format:
+            self.loca = struct.unpack_from(">%dI" % (num_glyphs + 1), data, loca)
+        else:
+            self.loca = [x * 2 for x in struct.unpack_from(">%dH" % (num_glyphs + 1), data, loca)]
+        self._cmap = self._read_cmap()
+        self._outlines = {}
+        self._lock = threading.Lock()
+
+    def _read_cmap(self):
+        """读取Unicode字符到字形编号的映射表，优先使用format 12（完整Unicode），其次format 4"""
+        data = self.data
+        cmap = self.tables["cmap"][0]
+        subtables = {}
+        for i in range(struct.unpack_from(">H", data, cmap + 2)[0]):
+            platform, encoding, offset = struct.unpack_from(">HHI", data, cmap + 4 + 8 * i)
+            subtables[(platform, encoding)] = cmap + offset
+        for key in ((3, 10), (0, 4), (3, 1), (0, 3), (0, 1), (0, 0)):
+            offset = subtables.get(key)
+            if offset is None:
+                continue
+            fmt = struct.unpack_from(">H", data, offset)[0]
+            if fmt == 12:
+                groups = struct.unpack_from(">I", data, offset + 12)[0]
+                return ("12", [struct.unpack_from(">III", data, offset + 16 + 12 * i) for i in range(groups)])
+            if fmt == 4:
+                seg_count = struct.unpack_from(">H", data, offset + 6)[0] // 2
+                ends = struct.unpack_from(">%dH" % seg_count, data, offset + 14)
+                starts_at = offset + 16 + 2 * seg_count
+                starts = struct.unpack_from(">%dH" % seg_count, data, starts_at)
+                deltas = struct.unpack_from(">%dh" % seg_count, data, starts_at + 2 * seg_count)
+                range_at = starts_at + 4 * seg_count
+                ranges = struct.unpack_from(">%dH" % seg_count, data, range_at)
+                return ("4", (ends, starts, deltas, ranges, range_at))
+        raise ValueError("字体中没有Unicode字符映射表")
+
+    def glyph_index(self, ch):
+        """字符对应的字形编号，字体中没有该字符时返回0"""
+        code = ord(ch)
+        fmt, table = self._cmap
+        if fmt == "12":
+            for start, end, glyph in table:
+                if start <= code <= end:
+                    return glyph + code - start
+            return 0
+        ends, starts, deltas, ranges, range_at = table
+        for i, end in enumerate(ends):
+            if code > end:
+                continue
+            if code < starts[i]:
+                return 0
+            if not ranges[i]:
+                return (code + deltas[i]) & 0xFFFF
+            at = range_at + 2 * i + ranges[i] + 2 * (code - starts[i])
+            glyph = struct.unpack_from(">H", self.data, at)[0]
+            return (glyph + deltas[i]) & 0xFFFF if glyph else 0
+        return 0
+
+    def outline(self, ch):
+        """字符的轮廓路径段列表"""
+        with self._lock:
+            segments = self._outlines.get(ch)
+        if segments is None:
+            segments = []
+            for contour in self._contours(self.glyph_index(ch), 0):
+                segments += self._contour_segments(contour)
+            with self._lock:
+                self._outlines[ch] = segments
+        return segments
+
+    def _contours(self, glyph, depth):
+        """读取字形的轮廓点，返回 [[(x, y, 是否在曲线上), ...], ...]，复合字形展开为各部件的轮廓"""
+        data = self.data
+        start, end = self.loca[glyph], self.loca[glyph + 1]
+        if start == end or depth > 8:
+            return []
+        at = self.tables["glyf"][0] + start
+        num_contours = struct.unpack_from(">h", data, at)[0]
+        at += 10
+
+        if num_contours < 0:
+            contours = []
+            while True:
+                flags, component = struct.unpack_from(">HH", data, at)
+                at += 4
+                if flags & 0x0001:
+                    dx, dy = struct.unpack_from(">hh", data, at)
+                    at += 4
+                else:
+                    dx, dy = struct.unpack_from(">bb", data, at)
+                    at += 2
+                if not flags & 0x0002:
+                    # 按点号对齐的部件较少见，这里不做偏移
+                    dx = dy = 0
+                a, b, c, d = 1.0, 0.0, 0.0, 1.0
+                if flags & 0x0008:
+                    a = d = struct.unpack_from(">h", data, at)[0] / 16384
+                    at += 2
+                elif flags & 0x0040:
+                    a, d = (v / 16384 for v in struct.unpack_from(">hh", data, at))
+                    at += 4
+                elif flags & 0x0080:
+                    a, b, c, d = (v / 16384 for v in struct.unpack_from(">hhhh", data, at))
+                    at += 8
+                for contour in self._contours(component, depth + 1):
+                    contours.append([(a * x + c * y + dx, b * x + d * y + dy, on) for x, y, on in contour])
+                if not flags & 0x0020:
+                    return contours
+
+        end_points = struct.unpack_from(">%dH" % num_contours, data, at)
+        at += 2 * num_contours
+        at += 2 + struct.unpack_from(">H", data, at)[0]  # 跳过hinting指令
+        count = end_points[-1] + 1 if num_contours else 0
+
+        flags = []
+        while len(flags) < count:
+            flag = data[at]
+            at += 1
+            flags.append(flag)
+            if flag & 0x08:
+                flags += [flag] * data[at]
+                at += 1
+
+        coords = []
+        for short_bit, same_bit in ((0x02, 0x10), (0x04, 0x20)):
+            value = 0
+            values = []
+            for flag in flags:
+                if flag & short_bit:
+                    delta = data[at]
+                    at += 1
+                    value += delta if flag & same_bit else -delta
+                elif not flag & same_bit:
+                    value += struct.unpack_from(">h", data, at)[0]
+                    at += 2
+                values.append(value)
+            coords.append(values)
+
+        contours = []
+        first = 0
+        for last in end_points:
+            contours.append([(coords[0][i], coords[1][i], flags[i] & 0x01) for i in range(first, last + 1)])
+            first = last + 1
+        return contours
+
+    @staticmethod
+    def _contour_segments(contour):
+        """把二次B样条轮廓点转换为路径段，相邻两个曲线外的点之间补上隐含的中点"""
+        if not contour:
+            return []
+        if contour[0][2]:
+            start = contour[0]
+            points = contour[1:]
+        elif contour[-1][2]:
+            start = contour[-1]
+            points = contour[:-1]
+        else:
+            start = ((contour[0][0] + contour[-1][0]) / 2, (contour[0][1] + contour[-1][1]) / 2, 1)
+            points = contour
+        segments = [("M", start[0], start[1])]
+        control = None
+        for x, y, on in list(points) + [start]:
+            if on:
+                if control is None:
+                    segments.append(("L", x, y))
+                else:
+                    segments.append(("Q", control[0], control[1], x, y))
+                    control = None
+            else:
+                if control is not None:
+                    segments.append(("Q", control[0], control[1], (control[0] + x) / 2, (control[1] + y) / 2))
+                control = (x, y)
+        segments.append(("Z",))
+        return segments
+
+@lru_cache(maxsize=16)
+def font_outlines(font_file):
+    """按字体文件名获取FontOutlines（每个字体只解析一次）"""
+    return FontOutlines(font_path(font_file))
@@ -0,0 +1,386 @@
+# 印章生成与签名：SealGenerator、签名密钥缓存，以及批量生成的工作进程函数
+import hashlib
+import base64
+import copy
+import json
+import multiprocessing
+import os
+import queue
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from contextlib import ExitStack
+import numpy as np
+# type: ignore
+from cryptography.hazmat.primitives import hashes
+# type: ignore
+from cryptography.hazmat.primitives.asymmetric import ec
+# type: ignore
+from cryptography.hazmat.primitives import serialization
+# type: ignore
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature
+
+from .monitoring import metrics
+from .png import encode_image
+from .watermark import (embed_watermark_array, hash_file, is_binary_watermark_data, make_watermark_data,
+                        WATERMARK_BINARY_HEAD, WATERMARK_KEY_P256, WATERMARK_MAGIC, WATERMARK_VERSION_BINARY,
+                        WATERMARK_VERSION_JSON, WATERMARK_VERSION_LEGACY)
+from .render import seal_cache, Stamp
+
+class SealGenerator:
+    seal_cache = None  # 印章整图缓存，None表示不使用缓存
+    # 新水印使用的格式版本，设为WATERMARK_VERSION_LEGACY兼容旧版验证程序；默认值可由环境变量SEAL_WATERMARK_VERSION指定，
+    # 进程池的工作进程重新导入本模块，实例上的设置由create_seals、sign_documents和generate_seal显式传给工作进程
+    watermark_version = int(os.environ.get("SEAL_WATERMARK_VERSION", WATERMARK_VERSION_BINARY))
+
+    def __init__(self, private_key=None):
+        self.private_key = private_key or ec.generate_private_key(ec.SECP256R1())
+        self.public_key = self.private_key.public_key()
+
+        # 公钥序列化结果只计算一次，每次加水印直接复用
+        self.public_key_pem = self.public_key.public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        ).decode()
+        self._public_key_json = json.dumps(self.public_key_pem)
+        self.public_key_point = self.public_key.public_bytes(
+            encoding=serialization.Encoding.X962,
+            format=serialization.PublicFormat.CompressedPoint
+        )
+        self.fingerprint = hashlib.sha256(self.public_key.public_bytes(
+            encoding=serialization.Encoding.DER,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        )).hexdigest()
+
+    def create_seal(self, company_name, bottom_text, size=400, layout=None):
+        """
+            创建印章核心方法（使用sealGenerate.py方式）
+            layout：预先计算好的StampLayout（如批量生成时由主进程传来），需与参数一致
+        """
+        stamp = self.make_stamp(company_name, bottom_text, size)
+        if layout is not None:
+            stamp.use_layout(layout)
+
+        # 相同参数的印章直接从缓存复制
+        cache = self.seal_cache
+        if cache is not None:
+            key = stamp.cache_key()
+            img = cache.get(key)
+            if img is not None:
+                return img
+
+        stamp.draw_stamp()
+        if cache is not None:
+            cache.put(key, stamp.img)
+        return stamp.img
+
+    def create_seal_vector(self, company_name, bottom_text, size=400, format="svg", scale=1.0):
+        """
+            生成矢量印章，与create_seal的版式相同；format为"svg"时返回文本，"pdf"时返回字节
+            scale：SVG为宽高倍数，PDF为每像素对应的点数；矢量输出中不含水印
+        """
+        stamp = self.make_stamp(company_name, bottom_text, size)
+        if format == "pdf":
+            return stamp.to_pdf(scale)
+        return stamp.to_svg(scale)
+
+    def create_seal_sizes(self, company_name, bottom_text, sizes, document=None, digest=None):
+        """
+            一次布局生成多个尺寸的同一印章（如缩略图、预览和打印版），返回 (图片列表, 水印数据)
+            sizes：与create_seal的size含义相同；版式按最大尺寸计算，较小的输出由最大的一张缩小得到，
+            因此图片宽度按比例取整，可能与单独调用create_seal时相差一个像素
+            指定document时只签名一次，分别嵌入每张图片
+        """
+        top = max(sizes)
+        images = self.make_stamp(company_name, bottom_text, top).rasterize_sizes([size / top for size in sizes])
+        watermark_data = None
+        if document:
+            file_hash, file_size = digest or hash_file(document)
+            if not file_size:
+                raise ValueError(f"文件为空: {document}")
+            watermark_data = make_watermark_data(company_name, file_hash, file_size)
+            payload = self.watermark_payload(watermark_data)
+            images = [self._embed_watermark_bytes(img, payload) for img in images]
+        return images, watermark_data
+
+    @staticmethod
+    def make_stamp(company_name, bottom_text, size=400):
+        """按尺寸计算印章参数，返回未绘制的Stamp"""
+        # 根据尺寸计算参数
+        R = int(size * 0.65)  # 外圆半径
+        H = int(size * 0.25)  # 圆心到中层文字距离
+        r = int(size * 0.25)  # 五角星半径
+        
+        stamp = Stamp(
+            R=R,
+            H=H,
+            r=r,
+            edge=int(size*0.04),
+            border=int(size*0.04),
+            fill=(220, 20, 20, 180),
+            words_up=company_name,
+            words_mid="",
+            words_down=bottom_text,
+            angle_up=270,
+            angle_down=60,
+            font_size_up=int(size*0.2),
+            font_size_down=int(size*0.1),
+            save_path="temp.png"
+        )
+        return stamp
+
+    def create_signed_seal(self, company_name, bottom_text="", size=400, document=None, digest=None, layout=None):
+        """
+            生成印章，指定document文件时嵌入该文件的签名水印，返回 (图片, 水印数据)
+            digest：已计算好的 (文件哈希, 文件大小)，不指定时分块读取document计算
+            layout：预先计算好的StampLayout
+        """
+        img = self.create_seal(company_name, bottom_text, size, layout)
+        watermark_data = None
+        if document:
+            file_hash, file_size = digest or hash_file(document)
+            if not file_size:
+                raise ValueError(f"文件为空: {document}")
+            watermark_data = make_watermark_data(company_name, file_hash, file_size)
+            img = self.add_watermark(img, watermark_data)
+        return img, watermark_data
+
+    def create_seals(self, specs, workers=None, ordered=True, image_format=None, hash_workers=0):
+        """
+            批量生成印章，使用进程池并行绘制，逐个产出结果
+            specs：可迭代的印章参数字典，包含 company_name、bottom_text、size、document（待签名文件路径，可选）
+            workers：进程数，None为CPU核数，0或1时在当前进程内顺序生成
+            ordered：是否按输入顺序产出结果
+            image_format：指定时（如"PNG"）在工作进程内编码，结果中为data字节，否则为image图片
+            hash_workers：大于0时在当前进程的线程池中预先并发计算待签名文件的哈希，绘制进程不再读取文件
+            结果为字典：index、spec、image或data、watermark_data、error（失败时的错误信息）
+            使用进程池时版式在当前进程中计算（相同参数只计算一次）并随任务传给绘制进程
+        """
+        jobs = ((index, spec, image_format, None, None) for index, spec in enumerate(specs))
+        with ExitStack() as stack:
+            if hash_workers:
+                hasher = stack.enter_context(ThreadPoolExecutor(max_workers=hash_workers))
+                jobs = _stream_pool(hasher, _hash_job, jobs, hash_workers * 2, True)
+
+            if workers is not None and workers <= 1:
+                for job in jobs:
+                    yield _render_seal_job(self, job)
+                return
+
+            key_pem = self.private_key.private_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PrivateFormat.PKCS8,
+                encryption_algorithm=serialization.NoEncryption()
+            )
+            workers = workers or os.cpu_count() or 1
+            executor = stack.enter_context(ProcessPoolExecutor(
+                max_workers=workers, mp_context=pool_context(), initializer=_init_batch_worker,
+                initargs=(key_pem, self.watermark_version)))
+            yield from _stream_pool(executor, _batch_worker, map(_layout_job, jobs), workers * 4, ordered)
+
+    def with_watermark_version(self, watermark_version):
+        """返回使用指定水印格式的生成器：与当前格式相同时返回自身，否则返回共用密钥的副本（不修改共享的生成器）"""
+        if watermark_version == self.watermark_version:
+            return self
+        generator = copy.copy(self)
+        generator.watermark_version = watermark_version
+        return generator
+
+    def add_watermark(self, image, data):
+        """添加数字水印"""
+        return self._embed_watermark_bytes(image, self.watermark_payload(data))
+
+    def watermark_payload(self, data):
+        """
+            对水印数据签名，返回嵌入图片的字节（同一数据可嵌入多张图片）
+            make_watermark_data构建的数据使用二进制格式（版本2），其他数据或watermark_version为1时使用JSON格式，
+            watermark_version为0时使用不带魔数的JSON格式
+        """
+        # 两种格式都对排序后的JSON文本签名，验证时由解出的数据重新生成
+        message = json.dumps(data, sort_keys=True)
+        if self.watermark_version == WATERMARK_VERSION_BINARY and is_binary_watermark_data(data):
+            r, s = decode_dss_signature(self._sign(message.encode()))
+            issuer = data["issuer"].encode()
+            timestamp = data["timestamp"].encode()
+            return (WATERMARK_MAGIC + bytes([WATERMARK_VERSION_BINARY]) + WATERMARK_BINARY_HEAD.pack(
+                WATERMARK_KEY_P256, self.public_key_point, r.to_bytes(32, "big") + s.to_bytes(32, "big"),
+                data["file_size"], bytes.fromhex(data["file_hash"]), len(timestamp), len(issuer))
+                    + timestamp + issuer)
+
+        signature = self._generate_signature(message)
+        # 与 json.dumps({"data", "signature", "public_key"}) 的结果逐字节相同，公钥部分使用缓存的片段
+        watermark_str = '{"data": %s, "signature": %s, "public_key": %s}' % (
+            json.dumps(data), json.dumps(signature), self._public_key_json)
+        if self.watermark_version == WATERMARK_VERSION_LEGACY:
+            return watermark_str.encode()
+        return self._watermark_prefix + watermark_str.encode()
+
+    def _generate_signature(self, data):
+        """生成数字签名"""
+        return base64.b64encode(self._sign(data.encode())).decode()
+
+    def _sign(self, message):
+        """ECDSA-SHA256签名，返回DER编码的签名"""
+        with metrics.stage("sign"):
+            return self.private_key.sign(
+                message,
+                ec.ECDSA(hashes.SHA256())
+            )
+
+    _watermark_prefix = WATERMARK_MAGIC + bytes([WATERMARK_VERSION_JSON])
+
+    def _embed_watermark_bytes(self, image, watermark_bytes):
+        """把已编码的水印数据嵌入图片"""
+        with metrics.stage("embed"):
+            arr = embed_watermark_array(np.array(image), watermark_bytes)
+            image.frombytes(arr.tobytes())
+        return image
+
+class KeyRegistry:
+    """
+        密钥注册表：同一私钥只解析一次，按PEM内容的摘要复用对应的SealGenerator（可跨请求、跨线程共享）
+        ephemeral_pool大于0时，在后台线程中预先生成临时密钥，未提供私钥的请求不必同步生成密钥
+    """
+
+    def __init__(self, max_keys=256, ephemeral_pool=0):
+        self.max_keys = max_keys  # 最多缓存的私钥个数
+        self.ephemeral_pool = ephemeral_pool  # 预生成的临时密钥个数
+        self._generators = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = queue.Queue(maxsize=max(ephemeral_pool, 1))
+        self._prefill_thread = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key_pem):
+        """根据PEM格式的私钥获取SealGenerator"""
+        if isinstance(key_pem, str):
+            key_pem = key_pem.encode()
+        digest = hashlib.sha256(key_pem).hexdigest()
+        with self._lock:
+            generator = self._generators.get(digest)
+            if generator is not None:
+                self._generators.move_to_end(digest)
+                self.hits += 1
+                return generator
+            self.misses += 1
+
+        generator = SealGenerator(serialization.load_pem_private_key(key_pem, password=None))
+        with self._lock:
+            generator = self._generators.setdefault(digest, generator)
+            while len(self._generators) > self.max_keys:
+                self._generators.popitem(last=False)
+        return generator
+
+    def ephemeral(self):
+        """获取一个使用新临时密钥的SealGenerator，优先取后台预生成的"""
+        if not self.ephemeral_pool:
+            return SealGenerator()
+        self._start_prefill()
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return SealGenerator()
+
+    def _start_prefill(self):
+        with self._lock:
+            if self._prefill_thread is None:
+                self._prefill_thread = threading.Thread(target=self._prefill, name="key-prefill", daemon=True)
+                self._prefill_thread.start()
+
+    def _prefill(self):
+        while True:
+            self._pool.put(SealGenerator())
+
+    def stats(self):
+        """返回缓存命中和预生成密钥统计"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "keys": len(self._generators),
+                "ephemeral_ready": self._pool.qsize() if self.ephemeral_pool else 0,
+            }
+
+# 全局密钥注册表，环境变量SEAL_EPHEMERAL_KEYS指定预生成的临时密钥个数
+key_registry = KeyRegistry(ephemeral_pool=int(os.environ.get("SEAL_EPHEMERAL_KEYS", "4")))
+
+def _hash_job(job):
+    """预先计算批量任务中待签名文件的哈希，异常留给生成阶段记录"""
+    index, spec, image_format, digest, layout = job
+    document = spec.get("document")
+    if document:
+        try:
+            digest = hash_file(document)
+        except Exception as e:
+            digest = e
+    return index, spec, image_format, digest, layout
+
+def _layout_job(job):
+    """在主进程中为批量任务计算印章版式，参数有误时留给绘制进程报错"""
+    index, spec, image_format, digest, layout = job
+    try:
+        layout = SealGenerator.make_stamp(spec["company_name"], spec.get("bottom_text") or "",
+                                          int(spec.get("size") or 400)).layout()
+    except Exception:
+        layout = None
+    return index, spec, image_format, digest, layout
+
+def _render_seal_job(generator, job):
+    """生成批量任务中的一个印章，异常记录在结果的error字段中"""
+    index, spec, image_format, digest, layout = job
+    result = {"index": index, "spec": spec, "watermark_data": None, "error": None}
+    try:
+        if isinstance(digest, Exception):
+            raise digest
+        img, result["watermark_data"] = generator.create_signed_seal(
+            spec["company_name"], spec.get("bottom_text") or "", int(spec.get("size") or 400),
+            spec.get("document") or None, digest, layout)
+        if image_format:
+            result["data"] = encode_image(img, image_format)
+        else:
+            result["image"] = img
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+# 批量生成进程池中每个进程各自持有的生成器
+_batch_generator = None
+
+def _init_batch_worker(key_pem, watermark_version):
+    global _batch_generator
+    generator = key_registry.get(key_pem)
+    generator.seal_cache = seal_cache
+    _batch_generator = generator.with_watermark_version(watermark_version)
+
+def _batch_worker(job):
+    return _render_seal_job(_batch_generator, job)
+
+def _stream_pool(executor, fn, jobs, window, ordered):
+    """向进程池或线程池提交任务，最多同时保留window个未完成任务，按顺序或完成先后逐个产出结果"""
+    pending = deque()
+    for job in jobs:
+        pending.append(executor.submit(fn, job))
+        if len(pending) < window:
+            continue
+        if ordered:
+            yield pending.popleft().result()
+        else:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.remove(future)
+                yield future.result()
+    if ordered:
+        while pending:
+            yield pending.popleft().result()
+    else:
+        for future in as_completed(pending):
+            yield future.result()
+
+def pool_context():
+    """
+        进程池使用的启动方式：界面服务和哈希线程池都是多线程的，fork会复制其他线程持有的锁，
+        因此使用forkserver（不支持时用spawn），工作进程重新导入不含gradio的模块
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
@@ -0,0 +1,121 @@
+# 性能指标：各阶段耗时统计，可导出为Prometheus格式
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+class _Stage:
+    """计时上下文，退出时把耗时记入Metrics"""
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.record(self.name, time.perf_counter() - self.start)
+
+_NULL_STAGE = nullcontext()
+
+class Metrics:
+    """
+        生成流水线各阶段的耗时与次数统计
+        阶段：key_load、font_load、glyph_render、rotate、blur、hash、sign、embed、png_encode、file_write
+        enabled为False且当前线程没有在记录trace时，stage()返回共享的空上下文，几乎没有开销
+        在trace()内记录的耗时先按阶段累加，trace结束时每个阶段作为一次观测计入直方图，便于按请求定位慢的阶段
+        hooks：每次观测时调用 hook(阶段, 秒, 次数)，可用于对接其他监控系统
+    """
+    buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.hooks = []
+        self._stages = {}  # 阶段 -> [各桶计数, 观测次数, 调用次数, 总耗时]
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def stage(self, name):
+        """返回记录指定阶段耗时的上下文管理器"""
+        if not self.enabled and getattr(self._local, "trace", None) is None:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def record(self, name, seconds):
+        """记录一次阶段耗时：在trace内时累加到trace，否则直接计入统计"""
+        trace = getattr(self._local, "trace", None)
+        if trace is not None:
+            entry = trace.get(name)
+            if entry is None:
+                trace[name] = [1, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+        elif self.enabled:
+            self.observe(name, seconds)
+
+    def observe(self, name, seconds, count=1):
+        """把一次观测（count次调用共耗时seconds）计入统计并通知hooks"""
+        with self._lock:
+            stat = self._stages.get(name)
+            if stat is None:
+                stat = self._stages[name] = [[0] * len(self.buckets), 0, 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    stat[0][i] += 1
+            stat[1] += 1
+            stat[2] += count
+            stat[3] += seconds
+        for hook in self.hooks:
+            hook(name, seconds, count)
+
+    @contextmanager
+    def trace(self):
+        """记录当前线程内各阶段的耗时，产出 {阶段: [次数, 秒]}；enabled时结束后计入统计"""
+        previous = getattr(self._local, "trace", None)
+        trace = self._local.trace = {}
+        try:
+            yield trace
+        finally:
+            self._local.trace = previous
+            if self.enabled:
+                self.observe_trace(trace)
+
+    def observe_trace(self, trace):
+        """把一个trace（如工作进程返回的）计入统计"""
+        for name, (count, seconds) in trace.items():
+            self.observe(name, seconds, count)
+
+    def snapshot(self):
+        """返回各阶段的观测次数、调用次数和总耗时"""
+        with self._lock:
+            return {name: {"observations": stat[1], "calls": stat[2], "seconds": stat[3]}
+                    for name, stat in self._stages.items()}
+
+    def clear(self):
+        with self._lock:
+            self._stages.clear()
+
+    def prometheus(self):
+        """按Prometheus文本格式导出各阶段的耗时直方图和调用次数"""
+        with self._lock:
+            stages = sorted((name, [list(stat[0])] + stat[1:]) for name, stat in self._stages.items())
+        lines = ["# HELP seal_stage_seconds 印章生成各阶段耗时（秒）",
+                 "# TYPE seal_stage_seconds histogram"]
+        for name, (counts, observations, calls, seconds) in stages:
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f'seal_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+            lines.append(f'seal_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {observations}')
+            lines.append(f'seal_stage_seconds_sum{{stage="{name}"}} {seconds}')
+            lines.append(f'seal_stage_seconds_count{{stage="{name}"}} {observations}')
+        lines += ["# HELP seal_stage_calls_total 印章生成各阶段调用次数",
+                  "# TYPE seal_stage_calls_total counter"]
+        for name, (_, _, calls, _) in stages:
+            lines.append(f'seal_stage_calls_total{{stage="{name}"}} {calls}')
+        return "\n".join(lines) + "\n"
+
+# 全局指标，环境变量SEAL_METRICS=1时启用
+metrics = Metrics(enabled=os.environ.get("SEAL_METRICS") == "1")
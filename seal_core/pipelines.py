@@ -0,0 +1,219 @@
+# 批量验证印章图片和批量签名文件
+import ntpath
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+import numpy as np
+# type: ignore
+from cryptography.hazmat.primitives import serialization
+
+from .monitoring import metrics
+from .png import PngTemplate
+from .watermark import (embed_watermark_array, hash_file, hash_stream, make_watermark_data, verify_seal_file,
+                        watermark_pixels)
+from .generator import key_registry, pool_context, _stream_pool
+
+SEAL_IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp")  # 批量验证时读取的图片类型
+
+def iter_seal_images(source):
+    """列出目录（递归）或zip文件中的印章图片，产出 (名称, 文件路径或图片字节)"""
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(SEAL_IMAGE_EXTENSIONS):
+                    path = os.path.join(root, name)
+                    yield os.path.relpath(path, source), path
+    else:
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(SEAL_IMAGE_EXTENSIONS):
+                    yield info.filename, archive.read(info)
+
+def _verify_job(job):
+    """验证批量任务中的一张图片"""
+    name, source = job
+    try:
+        result = verify_seal_file(source)
+    except Exception as e:
+        result = {"status": "corrupt", "data": None, "error": f"图片无法读取: {e}"}
+    return {"file": name, **result}
+
+def verify_seals(source, workers=None, ordered=True):
+    """
+        批量验证目录或zip文件中的印章图片，使用进程池并行，逐个产出 _verify_job 的结果字典
+        workers：进程数，None为CPU核数，0或1时在当前进程内顺序验证
+    """
+    jobs = iter_seal_images(source)
+    if workers is not None and workers <= 1:
+        for job in jobs:
+            yield _verify_job(job)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context()) as executor:
+        yield from _stream_pool(executor, _verify_job, jobs, workers * 4, ordered)
+
+def iter_documents(source, stack):
+    """
+        列出目录（递归）或zip文件中的待签名文件，返回产出 (名称, 文件路径或打开文件的函数) 的迭代器
+        zip文件立即在stack中打开，随stack关闭，保证后台线程读取完成前不会被关闭
+    """
+    if os.path.isdir(source):
+        return _safe_names(_iter_files(source))
+    archive = stack.enter_context(zipfile.ZipFile(source))
+    return _safe_names((info.filename, lambda info=info: archive.open(info))
+                       for info in archive.infolist() if not info.is_dir())
+
+def document_name(name):
+    """
+        把zip成员名或目录中的相对路径转换为可用作输出路径的相对名称：统一使用/分隔，去掉盘符和开头的/
+        含有..的名称会指向输出目录之外，抛出ValueError
+    """
+    parts = [part for part in ntpath.splitdrive(name.replace("\\", "/"))[1].split("/") if part not in ("", ".")]
+    if not parts or ".." in parts:
+        raise ValueError(f"不安全的文件名: {name}")
+    return "/".join(parts)
+
+def _safe_names(documents):
+    """规范化 (名称, 文件) 中的名称，不安全的名称以异常代替文件，在结果中记为失败"""
+    for name, document in documents:
+        try:
+            yield document_name(name), document
+        except ValueError as e:
+            yield name, e
+
+def _path_names(paths):
+    """
+        文件路径列表的输出名称：相对于各文件共同上级目录的路径，输入路径可以是绝对路径或含有..；
+        同一文件出现多次时在扩展名前加序号，如 a (2).txt
+    """
+    paths = [os.fspath(path) for path in paths]
+    try:
+        root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths]) if paths else ""
+    except ValueError:
+        root = None  # 不在同一盘符上，只使用文件名
+    used = set()
+    for path in paths:
+        if root is None:
+            name = os.path.basename(path)
+        else:
+            name = os.path.relpath(os.path.abspath(path), root).replace(os.sep, "/")
+        stem, ext = os.path.splitext(name)
+        count = 1
+        while name in used:
+            count += 1
+            name = f"{stem} ({count}){ext}"
+        used.add(name)
+        yield name, path
+
+def _iter_files(source):
+    for root, dirs, files in os.walk(source):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            yield os.path.relpath(path, source), path
+
+def _document_hash_job(job):
+    """计算待签名文件的哈希，异常留给签名阶段记录"""
+    index, name, document = job
+    try:
+        if isinstance(document, Exception):
+            raise document
+        if callable(document):
+            with document() as f:
+                digest = hash_stream(f)
+        else:
+            digest = hash_file(document)
+    except Exception as e:
+        digest = e
+    return index, name, digest
+
+class DocumentSigner:
+    """
+        同一印章批量签名文件：底图只绘制一次，每个文件只需签名、把水印写入底图开头几行的副本，
+        再用PngTemplate编码（只压缩变化的几行）
+    """
+    margin = 64  # 预留的水印长度余量（字节），水印更长时重新生成PNG模板
+
+    def __init__(self, generator, company_name, base):
+        self.generator = generator
+        self.company_name = company_name
+        self.base = np.asarray(base)
+        self.template = None
+
+    def sign(self, job):
+        """job为 (序号, 文件名, (哈希, 大小)或异常)，返回结果字典：index、document、data、watermark_data、error"""
+        index, name, digest = job
+        result = {"index": index, "document": name, "data": None, "watermark_data": None, "error": None}
+        try:
+            if isinstance(digest, Exception):
+                raise digest
+            file_hash, file_size = digest
+            if not file_size:
+                raise ValueError(f"文件为空: {name}")
+            watermark_data = make_watermark_data(self.company_name, file_hash, file_size)
+            payload = self.generator.watermark_payload(watermark_data)
+
+            # 余量不占用最后一行，小图上也保留预先压缩的部分；水印超出图片容量时由embed_watermark_array报错
+            height, width = self.base.shape[:2]
+            rows = -(-watermark_pixels(len(payload)) // width)
+            if self.template is None or rows > self.template.rows:
+                self.template = PngTemplate(self.base, max(rows, min(
+                    -(-watermark_pixels(len(payload) + self.margin) // width), height - 1)))
+            with metrics.stage("embed"):
+                prefix = embed_watermark_array(self.base[:self.template.rows].copy(), payload)
+            result["data"] = self.template.encode(prefix)
+            result["watermark_data"] = watermark_data
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+        return result
+
+# 批量签名进程池中每个进程各自持有的DocumentSigner
+_document_signer = None
+
+def _init_sign_worker(key_pem, watermark_version, company_name, size, base_bytes):
+    global _document_signer
+    base = np.frombuffer(base_bytes, dtype=np.uint8).reshape(size[1], size[0], 4)
+    generator = key_registry.get(key_pem).with_watermark_version(watermark_version)
+    _document_signer = DocumentSigner(generator, company_name, base)
+
+def _sign_worker(job):
+    return _document_signer.sign(job)
+
+def sign_documents(generator, company_name, bottom_text, source, size=400, workers=None, hash_workers=4,
+                   ordered=True):
+    """
+        用同一个印章批量签名文件，逐个产出DocumentSigner.sign的结果（data为PNG字节）
+        source：目录、zip文件，或文件路径的可迭代对象（输出名称为相对于这些文件共同上级目录的路径）
+        workers：签名和编码的进程数，None为CPU核数，0或1时在当前进程内进行
+        hash_workers：在当前进程中并发计算文件哈希的线程数
+    """
+    base = generator.create_seal(company_name, bottom_text, int(size)).convert("RGBA")
+    with ExitStack() as stack:
+        if isinstance(source, str):
+            documents = iter_documents(source, stack)
+        else:
+            documents = _path_names(source)
+        jobs = ((index, name, document) for index, (name, document) in enumerate(documents))
+        hasher = stack.enter_context(ThreadPoolExecutor(max_workers=max(hash_workers, 1)))
+        jobs = _stream_pool(hasher, _document_hash_job, jobs, max(hash_workers, 1) * 2, True)
+
+        if workers is not None and workers <= 1:
+            signer = DocumentSigner(generator, company_name, base)
+            for job in jobs:
+                yield signer.sign(job)
+            return
+
+        key_pem = generator.private_key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption()
+        )
+        workers = workers or os.cpu_count() or 1
+        executor = stack.enter_context(ProcessPoolExecutor(
+            max_workers=workers, mp_context=pool_context(), initializer=_init_sign_worker,
+            initargs=(key_pem, generator.watermark_version, company_name, base.size,
+                      base.tobytes())))
+        yield from _stream_pool(executor, _sign_worker, jobs, workers * 4, ordered)
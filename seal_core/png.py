@@ -0,0 +1,156 @@
+# PNG编码：编码参数、可复用的PNG模板，以及只解码前几行像素的读取
+import io
+import os
+import struct
+import zlib
+import numpy as np
+
+from .monitoring import metrics
+
+# PNG编码参数：compress_level为0-9，越大越小越慢；optimize为True时额外搜索最优压缩（更慢）
+PNG_OPTIONS = {
+    "compress_level": int(os.environ.get("SEAL_PNG_COMPRESS_LEVEL", "6")),
+    "optimize": os.environ.get("SEAL_PNG_OPTIMIZE") == "1",
+}
+
+def encode_image(img, image_format="PNG", **options):
+    """把图片编码为字节，PNG默认使用PNG_OPTIONS中的参数，options可覆盖"""
+    if image_format.upper() == "PNG":
+        options = {**PNG_OPTIONS, **options}
+    with metrics.stage("png_encode"):
+        buf = io.BytesIO()
+        img.save(buf, format=image_format, **options)
+    return buf.getvalue()
+
+def _png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+def _png_filter(rows, previous=None):
+    """对RGBA像素行做PNG的Paeth滤波，previous为上一行（None表示没有上一行），返回带滤波类型字节的各行"""
+    x = rows.reshape(len(rows), -1).astype(np.int16)
+    up = np.zeros_like(x)
+    up[1:] = x[:-1]
+    if previous is not None:
+        up[0] = previous.reshape(-1)
+    left = np.zeros_like(x)
+    left[:, 4:] = x[:, :-4]
+    upleft = np.zeros_like(x)
+    upleft[:, 4:] = up[:, :-4]
+
+    p = left + up - upleft
+    pa, pb, pc = np.abs(p - left), np.abs(p - up), np.abs(p - upleft)
+    predictor = np.where((pa <= pb) & (pa <= pc), left, np.where(pb <= pc, up, upleft))
+    out = np.empty((len(rows), x.shape[1] + 1), dtype=np.uint8)
+    out[:, 0] = 4
+    out[:, 1:] = (x - predictor) & 0xFF
+    return out
+
+def _adler32_combine(adler1, adler2, length2):
+    """由两段数据各自的Adler-32计算拼接后的Adler-32"""
+    a1, b1 = adler1 & 0xFFFF, adler1 >> 16
+    a2, b2 = adler2 & 0xFFFF, adler2 >> 16
+    a = (a1 + a2 - 1) % 65521
+    b = (b1 + b2 + length2 * (a1 - 1)) % 65521
+    return (b << 16) | a
+
+class PngTemplate:
+    """
+        反复编码同一张RGBA底图、只有前rows行不同的PNG（嵌入水印只改动开头的像素）
+        其余各行的滤波和压缩结果预先计算：第rows行起独立滤波（不依赖上一行），压缩时用完全刷新隔开，
+        每次只需滤波、压缩变化的前几行，再拼接预先压缩好的数据
+    """
+
+    def __init__(self, base, rows, compress_level=None):
+        self.base = np.asarray(base)
+        self.height, self.width = self.base.shape[:2]
+        self.rows = min(rows, self.height)  # 可以变化的行数
+        self.compress_level = PNG_OPTIONS["compress_level"] if compress_level is None else compress_level
+
+        # 第rows行按没有上一行滤波，结果与Sub滤波相同，标记为Sub后解码时不再依赖变化的前几行；
+        # 整张图都可能变化时后缀为空，只压缩出结束块
+        if self.rows < self.height:
+            filtered = _png_filter(self.base[self.rows:])
+            filtered[0, 0] = 1
+            filtered = filtered.tobytes()
+        else:
+            filtered = b""
+        compressor = zlib.compressobj(self.compress_level, zlib.DEFLATED, -15)
+        self._suffix = compressor.compress(filtered) + compressor.flush()
+        self._suffix_adler = zlib.adler32(filtered)
+        self._suffix_length = len(filtered)
+        self._head = PNG_SIGNATURE + _png_chunk(b"IHDR", struct.pack(">IIBBBBB", self.width, self.height, 8, 6, 0, 0, 0))
+        self._tail = _png_chunk(b"IEND", b"")
+
+    def encode(self, rows):
+        """rows为前self.rows行的像素（形状与底图的前几行相同），返回完整的PNG字节"""
+        with metrics.stage("png_encode"):
+            filtered = _png_filter(rows).tobytes()
+            compressor = zlib.compressobj(self.compress_level, zlib.DEFLATED, -15)
+            prefix = compressor.compress(filtered) + compressor.flush(zlib.Z_FULL_FLUSH)
+            adler = _adler32_combine(zlib.adler32(filtered), self._suffix_adler, self._suffix_length)
+            idat = b"\x78\x9c" + prefix + self._suffix + struct.pack(">I", adler)
+            return self._head + _png_chunk(b"IDAT", idat) + self._tail
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+def _png_head_pixels(fp, count):
+    """
+        直接解析PNG数据流，只解压并反滤波开头count个像素，返回 (宽, 高, 像素数组)
+        仅支持8位、非隔行的RGB/RGBA图片，其他情况返回None
+    """
+    if fp.read(8) != PNG_SIGNATURE:
+        return None
+    decompressor = zlib.decompressobj()
+    raw = b""
+    need = None
+    while need is None or len(raw) < need:
+        head = fp.read(8)
+        if len(head) < 8:
+            return None
+        size, chunk_type = struct.unpack(">I4s", head)
+        if chunk_type == b"IHDR":
+            width, height, depth, color, _, _, interlace = struct.unpack(">IIBBBBB", fp.read(13))
+            fp.read(4)
+            if depth != 8 or interlace or color not in (2, 6) or not width or not height:
+                return None
+            bpp = 3 if color == 2 else 4
+            stride = width * bpp
+            count = min(count, width * height)
+            rows = -(-count // width)
+            # 最后一行只需要解到第count个像素
+            need = (rows - 1) * (stride + 1) + 1 + (count - (rows - 1) * width) * bpp
+        elif chunk_type == b"IDAT" and need is not None:
+            data = decompressor.unconsumed_tail + fp.read(size)
+            fp.read(4)
+            raw += decompressor.decompress(data, need - len(raw))
+        elif chunk_type == b"IEND":
+            return None
+        else:
+            fp.seek(size + 4, 1)
+
+    # 按PNG规范逐行反滤波
+    pixels = bytearray()
+    prev = bytearray(stride)
+    pos = 0
+    for _ in range(rows):
+        filter_type = raw[pos]
+        line = bytearray(raw[pos + 1:pos + 1 + stride])
+        pos += 1 + stride
+        for i in range(len(line)):
+            a = line[i - bpp] if i >= bpp else 0
+            b = prev[i]
+            if filter_type == 1:
+                line[i] = (line[i] + a) & 0xFF
+            elif filter_type == 2:
+                line[i] = (line[i] + b) & 0xFF
+            elif filter_type == 3:
+                line[i] = (line[i] + ((a + b) >> 1)) & 0xFF
+            elif filter_type == 4:
+                c = prev[i - bpp] if i >= bpp else 0
+                p = a + b - c
+                pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                predictor = a if pa <= pb and pa <= pc else (b if pb <= pc else c)
+                line[i] = (line[i] + predictor) & 0xFF
+        pixels += line
+        prev = line
+    return width, height, np.frombuffer(bytes(pixels), dtype=np.uint8).reshape(-1, bpp)[:count]
@@ -0,0 +1,715 @@
+# 印章绘制：排版表、栅格与矢量（SVG/PDF）输出，以及已绘制印章的缓存
+import hashlib
+import json
+import io
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+import numpy as np
+# type: ignore
+from PIL import Image, ImageDraw, ImageFilter
+from math import pi, cos, sin, tan, floor, ceil
+
+from .monitoring import metrics
+from .fonts import font_outlines, glyph_cache, is_Chinese, load_font
+
+# 计算五角星各个顶点
+# int R:五角星的长轴
+# int x, y:五角星的中心点
+# int yDegree:长轴与y轴的夹角
+def pentagram(x, y, R, yDegree=0):
+    rad = pi / 180  # 每度的弧度值
+    r = R * sin(18 * rad) / cos(36 * rad)  # 五角星短轴的长度
+
+    # 求取外圈点坐标
+    RVertex = [(x - (R * cos((90 + k * 72 + yDegree) * rad)), y - (R * sin((90 + k * 72 + yDegree) * rad))) for k in
+               range(5)]
+    # 求取内圈点坐标
+    rVertex = [(x - (r * cos((90 + 36 + k * 72 + yDegree) * rad)), y - (r * sin((90 + 36 + k * 72 + yDegree) * rad)))
+               for k in range(5)]
+
+    # 顶点左边交叉合并
+    vertex = [x for y in zip(RVertex, rVertex) for x in y]
+    return vertex
+
+# 计算圆的上下左右切点
+def circle(x, y, r):
+    return (x - r, y - r, x + r, y + r)
+
+class StampLayout:
+    """
+        印章版式：由Stamp.layout_params()一次计算出的五角星顶点和每个文字的位置，光栅和矢量输出共用
+        不可变、可哈希（按参数），可以pickle传给批量进程；每个文字的数据按下标存放在只读数组中：
+        centers：旋转中心 (n, 2)      angles：旋转角度 (n,)        radii：旋转半径 (n,)
+        bboxes：文字外框 (n, 4)       ink_bboxes：含描边的墨迹外框 (n, 4)
+        styles：各圈文字的 (字体文件, 字号, 横向比例, 笔画粗细, 是否翻转, 基线高度)，style为每个文字的样式下标
+    """
+    __slots__ = ("params", "text", "star", "styles", "style", "centers", "angles", "radii", "bboxes", "ink_bboxes",
+                 "_hash")
+
+    def __init__(self, params, text, star, styles, style, centers, angles, radii, bboxes, ink_bboxes):
+        values = (params, text, _readonly(star, np.float64), tuple(styles), _readonly(style, np.uint8),
+                  _readonly(centers, np.float64), _readonly(angles, np.float64), _readonly(radii, np.float64),
+                  _readonly(bboxes, np.int32), _readonly(ink_bboxes, np.int32), hash(params))
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("StampLayout不可修改")
+
+    def __reduce__(self):
+        return StampLayout, tuple(getattr(self, name) for name in self.__slots__[:-1])
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        return isinstance(other, StampLayout) and self.params == other.params
+
+    def __len__(self):
+        return len(self.text)
+
+    @property
+    def center(self):
+        """圆心坐标（图片宽高的一半）"""
+        return self.params[2] + self.params[0]
+
+    @property
+    def size(self):
+        """图片宽高"""
+        return 2 * self.center
+
+    @classmethod
+    def build(cls, params):
+        """按参数计算版式，字号等取值与Stamp相同"""
+        edge, H, R, border, r = params[:5]
+        center = R + edge
+        text, styles, style, centers, angles, radii, bboxes, ink_bboxes = [], [], [], [], [], [], [], []
+        for ring in range(3):
+            words, arc, font_size, font_xratio, stroke_width = params[5 + ring * 5:10 + ring * 5]
+            if not words:
+                continue
+            # 上圈文字从左到右顺时针排列，中层和下圈文字逆时针排列
+            angle_word = arc / len(words)
+            angle_word_curr = ((len(words) - 1) / 2) * angle_word * (1 if ring == 0 else -1)
+            for word in words:
+                font_file = "SIMSUN.ttf" if is_Chinese(word) else "arialr.ttf"
+                font = glyph_cache.get_font(font_file, font_size)
+                key = (font_file, font_size, font_xratio, stroke_width, ring > 0, font.getmetrics()[0])
+                if key not in styles:
+                    styles.append(key)
+                style.append(styles.index(key))
+                text.append(word)
+                bboxes.append(font.getbbox(word))
+                ink_bboxes.append(font.getbbox(word, stroke_width=stroke_width))
+                if ring == 1:
+                    # 中层文字不旋转，旋转中心沿水平方向按角度的正切分布
+                    centers.append((center + H * tan(angle_word_curr * pi / 180), center))
+                    angles.append(0)
+                    radii.append(H)
+                else:
+                    centers.append((center, center))
+                    angles.append(angle_word_curr)
+                    radii.append(R - border * 2)
+                angle_word_curr = angle_word_curr + (-angle_word if ring == 0 else angle_word)
+        return cls(params, "".join(text), pentagram(center, center, r), styles, style,
+                   np.reshape(centers, (-1, 2)), angles, radii, np.reshape(bboxes, (-1, 4)),
+                   np.reshape(ink_bboxes, (-1, 4)))
+
+    def glyph(self, i):
+        """第i个文字：(旋转中心xy, 旋转角度, 旋转半径, 文字, 字号, 横向比例, 笔画粗细, 是否翻转)"""
+        font_file, font_size, font_xratio, stroke_width, font_flip, _ = self.styles[self.style[i]]
+        return (tuple(self.centers[i].tolist()), float(self.angles[i]), float(self.radii[i]), self.text[i], font_size,
+                font_xratio, stroke_width, font_flip)
+
+    def __iter__(self):
+        return (self.glyph(i) for i in range(len(self.text)))
+
+def _readonly(values, dtype):
+    arr = np.array(values, dtype=dtype)
+    arr.flags.writeable = False
+    return arr
+
+@lru_cache(maxsize=256)
+def stamp_layout(params):
+    """按Stamp.layout_params()获取版式，相同参数只计算一次"""
+    return StampLayout.build(params)
+
+class Stamp:
+    supersample = 4  # 旋转文字时的超采样倍数
+    glyph_pad = 4  # 字形图块四周的留白像素
+    glyph_cache = glyph_cache  # 字体与字形缓存，设为None则不使用缓存
+    blur_radius = 0.6  # 最后整体高斯模糊的半径
+
+    def __init__(self, edge=5,  # 图片边缘空白的距离
+                 H=160,  # 圆心到中层文字下边缘的距离
+                 R=250,  # 圆半径
+                 border=20,  # 字到圆圈内侧的距离
+                 r=90,  # 五星外接圆半径
+                 fill=(255, 0, 0, 120),  # 印章颜色， 默认纯红色， 透明度0-255，建议90-180
+
+                 words_up="上海市一个好鸟都没有有限公司",  # 上部文字
+                 angle_up=270,  # 上部文字弧形角度
+                 font_size_up=80,  # 上部文字大小
+                 font_xratio_up=0.66,  # 上部文字横向变形比例
+                 stroke_width_up=2,  # 上部文字粗细，一般取值0,1,2,3
+
+                 words_mid="测试专用章",  # 中部文字
+                 angle_mid=72,  # 中部文字弧形角度
+                 font_size_mid=60,  # 中部文字大小
+                 font_xratio_mid=0.7,  # 中部文字横向变形比例
+                 stroke_width_mid=1,  # 中部文字粗细，一般取值0,1,2
+
+                 words_down="0123456789",  # 下部文字
+                 angle_down=60,  # 下部文字弧形角度
+                 font_size_down=20,  # 下部文字大小
+                 font_xratio_down=1,  # 下部文字横向变形比例
+                 stroke_width_down=1,  # 下部文字粗细，一般取值0,1,2
+
+                 save_path="stamp.png"  # 保存图片路径
+                 ):
+
+        # 图像初始设置为None
+        self.img = None
+        self.save_path = save_path
+
+        self.fill = fill  # 印章颜色
+        self.edge = edge  # 图片边缘空白的距离
+        self.H = H  # 圆心到中层文字下边缘的距离
+        self.R = R  # 圆半径
+        self.r = r  # 五星外接圆半径
+        self.border = border  # 字到圆圈内侧的距离
+
+        self.words_up = words_up  # 上部文字
+        self.angle_up = angle_up  # 上部文字弧形角度
+        self.font_size_up = font_size_up  # 上部文字大小
+        self.font_xratio_up = font_xratio_up  # 上部文字横向变形比例
+        self.stroke_width_up = stroke_width_up  # 上部文字粗细，一般取值0,1,2,3
+
+        self.words_mid = words_mid  # 中部文字
+        self.angle_mid = angle_mid  # 中部文字弧形角度
+        self.font_size_mid = font_size_mid  # 中部文字大小
+        self.font_xratio_mid = font_xratio_mid  # 中部文字横向变形比例
+        self.stroke_width_mid = stroke_width_mid  # 中部文字粗细，一般取值0,1,2,3
+
+        self.words_down = words_down  # 下部文字
+        self.angle_down = angle_down  # 下部文字弧形角度
+        self.font_size_down = font_size_down  # 下部文字大小
+        self.font_xratio_down = font_xratio_down  # 下部文字横向变形比例
+        self.stroke_width_down = stroke_width_down  # 中部文字粗细，一般取值0,1,2,3
+
+        self._layout = None  # 最近一次使用的版式
+
+    def draw_rotated_text(self, image, angle, xy, r, word, fill, font_size, font_xratio, stroke_width, font_flip=False,
+                          *args, bboxes=None, **kwargs):
+        """
+            image:底层图片
+            angle：旋转角度
+            xy：旋转中心
+            r:旋转半径
+            text：绘制的文字
+            fill：文字颜色
+            font_size：字体大小
+            font_xratio：x方向缩放比例（印章字体宽度较标准宋体偏窄）
+            stroke_width： 文字笔画粗细
+            font_flip:文字是否垂直翻转（印章下部文字与上部是相反的）
+            bboxes：版式中预先计算的 (文字外框, 墨迹外框)，省去重复测量
+        """
+
+        # 加载字体文件-直接使用windows自带字体，中文用simsun， 英文用arial
+        font_file = "SIMSUN.ttf" if is_Chinese(word) else "arialr.ttf"
+        cache = self.glyph_cache
+        if cache is not None:
+            font = cache.get_font(font_file, font_size)
+        else:
+            font = load_font(font_file, font_size)
+
+        # 旋转中心拆分为整数部分和亚像素相位，字形图块只与相位有关，与底图大小无关
+        ix, iy = floor(xy[0]), floor(xy[1])
+        phase = (xy[0] - ix, xy[1] - iy)
+
+        # 额外的绘制参数无法作为缓存键，此时直接绘制
+        if cache is not None and not args and not kwargs:
+            key = (font_file, font_size, stroke_width, font_xratio, angle, font_flip, r, phase, word, self.supersample)
+            glyph = cache.get_glyph(key)
+            if glyph is None:
+                glyph = self.render_glyph(font, word, angle, r, font_xratio, stroke_width, font_flip, phase,
+                                          bboxes=bboxes)
+                cache.put_glyph(key, glyph)
+            mask, (ox, oy) = glyph
+        else:
+            mask, (ox, oy) = self.render_glyph(font, word, angle, r, font_xratio, stroke_width, font_flip, phase,
+                                               *args, bboxes=bboxes, **kwargs)
+
+        # 只在字形所在的小区域内粘贴印章颜色
+        color_image = Image.new('RGBA', mask.size, fill)
+        image.paste(color_image, (ix + ox, iy + oy), mask)
+
+    def render_glyph(self, font, word, angle, r, font_xratio, stroke_width, font_flip=False, phase=(0, 0),
+                     *args, bboxes=None, **kwargs):
+        """
+            在紧贴字形的小图块上绘制单个文字，并完成横向压缩和旋转
+            返回 (mask, (ox, oy))：mask为'L'模式的透明度图块，(ox, oy)为图块左上角相对旋转中心整数部分的偏移
+            phase：旋转中心的亚像素相位
+            bboxes：(文字外框, 墨迹外框)，为None时由字体测量
+        """
+        if bboxes is None:
+            bboxes = (font.getbbox(word), font.getbbox(word, stroke_width=stroke_width))
+        bd, sb = bboxes
+
+        # 文字基准点相对旋转中心的位置，与原整图绘制方式保持一致：文字上边中点在圆周上
+        font_width = bd[2] - bd[0]
+        font_hight = bd[3] - bd[1]
+        if font_flip:
+            word_pos = (floor(-font_width / 2), r - font_hight)
+        else:
+            word_pos = (floor(-font_width / 2), -r)
+
+        # 按描边后的墨迹范围创建图块，四周留白保证重采样时不截断笔画
+        pad = self.glyph_pad
+        with metrics.stage("glyph_render"):
+            tile = Image.new('L', (sb[2] - sb[0] + 2 * pad, sb[3] - sb[1] + 2 * pad), 0)
+            draw = ImageDraw.Draw(tile)
+            draw.text((pad - sb[0], pad - sb[1]), word, 255, font=font, align="center", stroke_width=stroke_width,
+                      *args, **kwargs)
+
+        # 图块左上角在旋转前（未压缩）坐标系中的位置
+        tile_x = word_pos[0] + sb[0] - pad
+        tile_y = word_pos[1] + sb[1] - pad
+        with metrics.stage("rotate"):
+            return self._transform_glyph(tile, tile_x, tile_y, angle, font_xratio, phase)
+
+    def _transform_glyph(self, tile, tile_x, tile_y, angle, font_xratio, phase):
+        """对字形图块做横向压缩和旋转，tile_x、tile_y为图块左上角在旋转前坐标系中的位置"""
+        tile_w, tile_h = tile.size
+        if angle % 360 == 0:
+            # 不旋转时直接按目标像素网格做横向压缩，相当于原整图缩放后的一个窗口
+            left = phase[0] + tile_x * font_xratio
+            top = phase[1] + tile_y
+            ox, oy = ceil(left), ceil(top)
+            width = max(floor(left + tile_w * font_xratio) - ox, 1)
+            height = max(floor(top + tile_h) - oy, 1)
+            box = ((ox - left) / font_xratio, oy - top,
+                   (ox - left + width) / font_xratio, oy - top + height)
+            return tile.resize((width, height), resample=Image.BICUBIC, box=box), (ox, oy)
+
+        # 印章通常使用较窄的字体，这里将图块x方向压缩到font_xratio的比例
+        width = max(int(tile_w * font_xratio), 1)
+        tile = tile.resize((width, tile_h), resample=Image.BICUBIC, box=(0, 0, width / font_xratio, tile_h))
+        tile_x = tile_x * font_xratio
+
+        # 旋转矩阵（与Image.rotate一致，角度为逆时针）
+        theta = -angle * pi / 180
+        c, s = cos(theta), sin(theta)
+
+        # 计算旋转后图块四角的位置，得到需要粘贴的区域
+        corners = []
+        for u, v in ((0, 0), (width, 0), (0, tile_h), (width, tile_h)):
+            px, py = tile_x + u, tile_y + v
+            corners.append((phase[0] + c * px - s * py, phase[1] + s * px + c * py))
+        ox = floor(min(p[0] for p in corners)) - 2
+        oy = floor(min(p[1] for p in corners)) - 2
+        out_w = ceil(max(p[0] for p in corners)) + 2 - ox
+        out_h = ceil(max(p[1] for p in corners)) + 2 - oy
+
+        # 在有限倍数的超采样网格上一次完成旋转和平移，再用LANCZOS缩回目标大小以减少锯齿
+        k = self.supersample
+        dx, dy = ox - phase[0], oy - phase[1]
+        data = (c / k, s / k, c * dx + s * dy - tile_x,
+                -s / k, c / k, -s * dx + c * dy - tile_y)
+        rotated = tile.transform((out_w * k, out_h * k), Image.AFFINE, data, resample=Image.BICUBIC)
+        return rotated.resize((out_w, out_h), resample=Image.LANCZOS), (ox, oy)
+
+    def draw_stamp(self):
+        img = self.draw_layers()
+        with metrics.stage("blur"):
+            self.img = img.filter(ImageFilter.GaussianBlur(self.blur_radius))
+
+    def draw_layers(self):
+        """绘制圆圈、五角星和全部文字，返回未模糊的图片"""
+        layout = self.layout()
+        img = self.draw_frame(layout)
+
+        # 绘制上、中、下三层文字
+        self.draw_glyphs(img, layout)
+        return img
+
+    def draw_frame(self, layout=None):
+        """创建底图并绘制圆圈和五角星"""
+        if layout is None:
+            layout = self.layout()
+        center = layout.center
+
+        # 创建一张底图,用来绘制文字
+        img = Image.new("RGBA", (layout.size, layout.size), (255, 255, 255, 0))
+        draw = ImageDraw.Draw(img)
+
+        # 绘制圆弧， R为外边缘，width往圆心算
+        draw.arc(circle(center, center, self.R), start=0, end=360, fill=self.fill, width=self.border)
+
+        # 绘制多边形
+        draw.polygon([tuple(point) for point in layout.star.tolist()], fill=self.fill, outline=self.fill)
+        return img
+
+    def draw_glyphs(self, img, layout, start=0, stop=None):
+        """按版式绘制第start到stop个文字（默认全部）"""
+        for i in range(start, len(layout) if stop is None else stop):
+            xy, angle, r, word, font_size, font_xratio, stroke_width, font_flip = layout.glyph(i)
+            self.draw_rotated_text(img, angle, xy, r, word, self.fill, font_size, font_xratio, stroke_width,
+                                   font_flip=font_flip,
+                                   bboxes=(tuple(layout.bboxes[i].tolist()), tuple(layout.ink_bboxes[i].tolist())))
+
+    def layout_params(self):
+        """版式相关的全部参数（不含颜色和模糊等绘制参数）"""
+        return (self.edge, self.H, self.R, self.border, self.r,
+                self.words_up, self.angle_up, self.font_size_up, self.font_xratio_up, self.stroke_width_up,
+                self.words_mid, self.angle_mid, self.font_size_mid, self.font_xratio_mid, self.stroke_width_mid,
+                self.words_down, self.angle_down, self.font_size_down, self.font_xratio_down, self.stroke_width_down)
+
+    def layout(self):
+        """返回当前参数的StampLayout，相同参数的版式在进程内只计算一次"""
+        params = self.layout_params()
+        if self._layout is None or self._layout.params != params:
+            self._layout = stamp_layout(params)
+        return self._layout
+
+    def use_layout(self, layout):
+        """使用预先计算（如由主进程传来）的版式，参数必须与当前Stamp一致"""
+        if layout.params != self.layout_params():
+            raise ValueError("版式参数与印章不一致")
+        self._layout = layout
+
+    def glyph_layout(self):
+        """
+            每个文字的位置列表，每项为 (旋转中心xy, 旋转角度, 旋转半径, 文字, 字号, 横向比例, 笔画粗细, 是否翻转)
+        """
+        return list(self.layout())
+
+    def scaled(self, scale):
+        """返回按比例缩放全部尺寸参数的Stamp，用于按任意分辨率光栅化"""
+        stamp = Stamp(
+            edge=round(self.edge * scale), H=self.H * scale, R=round(self.R * scale), border=round(self.border * scale),
+            r=self.r * scale, fill=self.fill,
+            words_up=self.words_up, angle_up=self.angle_up, font_size_up=round(self.font_size_up * scale),
+            font_xratio_up=self.font_xratio_up, stroke_width_up=round(self.stroke_width_up * scale),
+            words_mid=self.words_mid, angle_mid=self.angle_mid, font_size_mid=round(self.font_size_mid * scale),
+            font_xratio_mid=self.font_xratio_mid, stroke_width_mid=round(self.stroke_width_mid * scale),
+            words_down=self.words_down, angle_down=self.angle_down, font_size_down=round(self.font_size_down * scale),
+            font_xratio_down=self.font_xratio_down, stroke_width_down=round(self.stroke_width_down * scale),
+            save_path=self.save_path)
+        stamp.blur_radius = self.blur_radius * scale
+        return stamp
+
+    def rasterize(self, scale=1.0):
+        """按指定倍数绘制印章图片，如300DPI输出可取 scale = 目标像素宽度 / 当前宽度"""
+        stamp = self.scaled(scale) if scale != 1 else self
+        stamp.draw_stamp()
+        return stamp.img
+
+    def rasterize_sizes(self, scales):
+        """
+            同一版式按多个倍数绘制，返回与scales顺序对应的图片列表
+            只按最大倍数绘制一次，其余由它缩小得到（比直接按小尺寸绘制更清晰），每个输出各自模糊
+            印章是单色的：每个像素都是印章颜色按透明度与白色底色混合的结果，颜色由透明度唯一确定，
+            因此缩小和模糊只需处理透明度通道，最后再还原颜色
+        """
+        top = max(scales)
+        alpha = (self.scaled(top) if top != 1 else self).draw_layers().getchannel("A")
+        images = []
+        for scale in scales:
+            mask = alpha
+            if scale != top:
+                width = max(round(alpha.width * scale / top), 1)
+                mask = alpha.resize((width, width), resample=Image.LANCZOS, reducing_gap=3.0)
+            with metrics.stage("blur"):
+                mask = mask.filter(ImageFilter.GaussianBlur(self.blur_radius * scale))
+            images.append(self.colorize(mask))
+        return images
+
+    def colorize(self, alpha):
+        """由透明度通道还原印章图片：颜色 = 白色 + (印章颜色 - 白色) * 透明度 / 印章透明度"""
+        fill_alpha = self.fill[3] if len(self.fill) > 3 else 255
+        bands = [alpha.point([round(255 - (255 - c) * min(v / fill_alpha, 1)) for v in range(256)])
+                 for c in self.fill[:3]]
+        return Image.merge("RGBA", bands + [alpha])
+
+    def vector_shapes(self):
+        """
+            矢量输出使用的图形，坐标与光栅图片的像素坐标一致
+            ("ring", cx, cy, 半径, 线宽)：圆环（半径为线宽中心）
+            ("polygon", 顶点列表)：五角星
+            ("glyph", (a, b, c, d, e, f), 轮廓路径段, 描边宽度)：文字轮廓，矩阵把字体单位变换到像素坐标，描边宽度为字体单位
+        """
+        layout = self.layout()
+        center = layout.center
+        shapes = [("ring", center, center, self.R - self.border / 2, self.border),
+                  ("polygon", [tuple(point) for point in layout.star.tolist()])]
+        for i in range(len(layout)):
+            xy, angle, r, word, font_size, font_xratio, stroke_width, font_flip = layout.glyph(i)
+            font_file, ascent = layout.styles[layout.style[i]][0], layout.styles[layout.style[i]][5]
+            outlines = font_outlines(font_file)
+
+            # 与render_glyph相同的文字位置：文字基准点（左上）相对旋转中心的坐标，再加上基线到顶部的距离
+            bd = layout.bboxes[i].tolist()
+            if font_flip:
+                px, py = floor(-(bd[2] - bd[0]) / 2), r - (bd[3] - bd[1])
+            else:
+                px, py = floor(-(bd[2] - bd[0]) / 2), -r
+            py += ascent
+
+            # 字体单位 -> 基线坐标 -> 横向压缩 -> 旋转 -> 平移到旋转中心
+            k = font_size / outlines.units_per_em
+            theta = -angle * pi / 180
+            c, s = cos(theta), sin(theta)
+            matrix = (c * font_xratio * k, s * font_xratio * k, s * k, -c * k,
+                      c * font_xratio * px - s * py + xy[0], s * font_xratio * px + c * py + xy[1])
+            shapes.append(("glyph", matrix, outlines.outline(word), 2 * stroke_width / k))
+        return shapes
+
+    def to_svg(self, scale=1.0):
+        """输出SVG文本，scale为SVG宽高相对于像素尺寸的倍数"""
+        size = 2 * (self.R + self.edge)
+        color = "#%02x%02x%02x" % tuple(self.fill[:3])
+        opacity = (self.fill[3] if len(self.fill) > 3 else 255) / 255
+        parts = ['<svg xmlns="http://www.w3.org/2000/svg" width="%g" height="%g" viewBox="0 0 %d %d">'
+                 % (size * scale, size * scale, size, size),
+                 # 与光栅绘制一致，各图形重叠处不叠加透明度，因此透明度设置在整个分组上
+                 '<g fill="%s" stroke="%s" opacity="%.4g" stroke-linejoin="round">' % (color, color, opacity)]
+        for shape in self.vector_shapes():
+            if shape[0] == "ring":
+                _, cx, cy, radius, width = shape
+                parts.append('<circle cx="%g" cy="%g" r="%g" fill="none" stroke-width="%g"/>' % (cx, cy, radius, width))
+            elif shape[0] == "polygon":
+                points = " ".join("%.3f,%.3f" % point for point in shape[1])
+                parts.append('<polygon points="%s" stroke-width="1"/>' % points)
+            else:
+                _, matrix, segments, stroke = shape
+                if not segments:
+                    continue
+                d = "".join(seg[0] + " ".join("%g" % v for v in seg[1:]) for seg in segments)
+                stroke_attr = ' stroke-width="%g"' % stroke if stroke else ' stroke="none"'
+                parts.append('<path transform="matrix(%s)" d="%s"%s/>'
+                             % (" ".join("%.6g" % v for v in matrix), d, stroke_attr))
+        parts.append("</g></svg>")
+        return "\n".join(parts)
+
+    def to_pdf(self, scale=1.0):
+        """输出单页PDF字节，scale为每像素对应的点数（1点=1/72英寸），如 scale=0.75 相当于96DPI"""
+        size = 2 * (self.R + self.edge)
+        rgb = " ".join("%.4g" % (v / 255) for v in self.fill[:3])
+        opacity = (self.fill[3] if len(self.fill) > 3 else 255) / 255
+
+        # 内容画在透明组中，再整体按印章透明度绘制，与光栅绘制一样重叠处不叠加透明度；坐标系翻转为像素坐标
+        ops = ["%s rg %s RG 1 j" % (rgb, rgb)]
+        kappa = 0.5522847498
+        for shape in self.vector_shapes():
+            if shape[0] == "ring":
+                _, cx, cy, radius, width = shape
+                k = radius * kappa
+                ops.append("%g w %g %g m" % (width, cx + radius, cy))
+                for x1, y1, x2, y2, x3, y3 in ((cx + radius, cy + k, cx + k, cy + radius, cx, cy + radius),
+                                               (cx - k, cy + radius, cx - radius, cy + k, cx - radius, cy),
+                                               (cx - radius, cy - k, cx - k, cy - radius, cx, cy - radius),
+                                               (cx + k, cy - radius, cx + radius, cy - k, cx + radius, cy)):
+                    ops.append("%.3f %.3f %.3f %.3f %.3f %.3f c" % (x1, y1, x2, y2, x3, y3))
+                ops.append("S")
+            elif shape[0] == "polygon":
+                points = shape[1]
+                ops.append("1 w %.3f %.3f m" % points[0])
+                ops += ["%.3f %.3f l" % point for point in points[1:]]
+                ops.append("h B")
+            else:
+                _, matrix, segments, stroke = shape
+                if not segments:
+                    continue
+                ops.append("q %s cm" % " ".join("%.6g" % v for v in matrix))
+                x = y = 0
+                for seg in segments:
+                    if seg[0] == "M":
+                        x, y = seg[1:]
+                        ops.append("%g %g m" % (x, y))
+                    elif seg[0] == "L":
+                        x, y = seg[1:]
+                        ops.append("%g %g l" % (x, y))
+                    elif seg[0] == "Q":
+                        # 二次贝塞尔曲线转换为三次
+                        qx, qy, ex, ey = seg[1:]
+                        ops.append("%.2f %.2f %.2f %.2f %g %g c" % (x + 2 / 3 * (qx - x), y + 2 / 3 * (qy - y),
+                                                                    ex + 2 / 3 * (qx - ex), ey + 2 / 3 * (qy - ey),
+                                                                    ex, ey))
+                        x, y = ex, ey
+                    else:
+                        ops.append("h")
+                ops.append("%g w B Q" % stroke if stroke else "f Q")
+        form = zlib.compress("\n".join(ops).encode())
+
+        page = size * scale
+        objects = [
+            b"<< /Type /Catalog /Pages 2 0 R >>",
+            b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+            ("<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.3f %.3f] /Contents 4 0 R "
+             "/Resources << /ExtGState << /GS1 5 0 R >> /XObject << /Fm1 6 0 R >> >> >>" % (page, page)).encode(),
+            None,
+            ("<< /Type /ExtGState /ca %.4g /CA %.4g >>" % (opacity, opacity)).encode(),
+            ("<< /Type /XObject /Subtype /Form /BBox [0 0 %d %d] /Matrix [1 0 0 -1 0 %d] "
+             "/Group << /S /Transparency >> /Filter /FlateDecode /Length %d >>\nstream\n"
+             % (size, size, size, len(form))).encode() + form + b"\nendstream",
+        ]
+        content = ("q %g 0 0 %g 0 0 cm /GS1 gs /Fm1 Do Q" % (scale, scale)).encode()
+        objects[3] = b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream"
+
+        out = io.BytesIO()
+        out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        offsets = []
+        for number, body in enumerate(objects, 1):
+            offsets.append(out.tell())
+            out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref = out.tell()
+        out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            out.write(b"%010d 00000 n \n" % offset)
+        out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+        return out.getvalue()
+
+    def cache_key(self):
+        """根据所有绘制参数计算印章内容的哈希，用作整图缓存的键"""
+        params = {
+            "fill": self.fill, "edge": self.edge, "H": self.H, "R": self.R, "r": self.r, "border": self.border,
+            "words_up": self.words_up, "angle_up": self.angle_up, "font_size_up": self.font_size_up,
+            "font_xratio_up": self.font_xratio_up, "stroke_width_up": self.stroke_width_up,
+            "words_mid": self.words_mid, "angle_mid": self.angle_mid, "font_size_mid": self.font_size_mid,
+            "font_xratio_mid": self.font_xratio_mid, "stroke_width_mid": self.stroke_width_mid,
+            "words_down": self.words_down, "angle_down": self.angle_down, "font_size_down": self.font_size_down,
+            "font_xratio_down": self.font_xratio_down, "stroke_width_down": self.stroke_width_down,
+            "supersample": self.supersample, "glyph_pad": self.glyph_pad, "blur_radius": self.blur_radius,
+        }
+        return hashlib.sha256(json.dumps(params, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+    def show_stamp(self):
+        if self.img:
+            self.img.show()
+
+    def save_stamp(self):
+        if self.img:
+            self.img.save(self.save_path)
+
+class SealCache:
+    """
+        未加水印印章图片的整图缓存
+        内存中按字节数做LRU淘汰；指定 disk_dir 时额外写入磁盘，disk_format 可选 "png" 或 "raw"（RGBA原始数据）
+        缓存存取都返回副本，调用方可以直接在返回的图片上嵌入水印
+    """
+
+    def __init__(self, max_bytes=128 * 1024 * 1024, disk_dir=None, disk_format="png"):
+        if disk_format not in ("png", "raw"):
+            raise ValueError(f"不支持的磁盘缓存格式: {disk_format}")
+        self.max_bytes = max_bytes  # 内存缓存预算（字节）
+        self.disk_dir = disk_dir  # 磁盘缓存目录，None表示不使用
+        self.disk_format = disk_format
+        self._images = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key + (".png" if self.disk_format == "png" else ".rgba"))
+
+    def _load_disk(self, key):
+        path = self._disk_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            if self.disk_format == "png":
+                with Image.open(path) as img:
+                    return img.convert("RGBA")
+            with open(path, "rb") as f:
+                width, height = struct.unpack("<II", f.read(8))
+                return Image.frombytes("RGBA", (width, height), f.read())
+        except Exception:
+            # 损坏的缓存文件视为未命中
+            return None
+
+    def _save_disk(self, key, img):
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if self.disk_format == "png":
+            img.save(tmp_path, format="PNG")
+        else:
+            with open(tmp_path, "wb") as f:
+                f.write(struct.pack("<II", *img.size))
+                f.write(img.tobytes())
+        os.replace(tmp_path, path)
+
+    def _put_memory(self, key, img):
+        size = img.size[0] * img.size[1] * 4
+        if size > self.max_bytes:
+            return
+        old = self._images.pop(key, None)
+        if old is not None:
+            self._bytes -= old.size[0] * old.size[1] * 4
+        self._images[key] = img
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, evicted = self._images.popitem(last=False)
+            self._bytes -= evicted.size[0] * evicted.size[1] * 4
+            self.evictions += 1
+
+    def get(self, key):
+        """查找缓存的印章，命中返回图片副本，未命中返回None"""
+        with self._lock:
+            img = self._images.get(key)
+            if img is not None:
+                self._images.move_to_end(key)
+                self.hits += 1
+                return img.copy()
+
+        img = self._load_disk(key) if self.disk_dir else None
+        with self._lock:
+            if img is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._put_memory(key, img)
+        return img.copy()
+
+    def put(self, key, img):
+        """缓存印章图片的副本"""
+        img = img.copy()
+        with self._lock:
+            self._put_memory(key, img)
+        if self.disk_dir:
+            self._save_disk(key, img)
+
+    def clear(self):
+        """清空内存缓存和统计（磁盘文件保留）"""
+        with self._lock:
+            self._images.clear()
+            self._bytes = 0
+            self.hits = self.disk_hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """返回命中率和淘汰统计"""
+        with self._lock:
+            total = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits + self.disk_hits) / total if total else 0.0,
+                "evictions": self.evictions,
+                "images": len(self._images),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+# 全局共享的印章整图缓存，可通过环境变量SEAL_CACHE_DIR开启磁盘缓存
+seal_cache = SealCache(disk_dir=os.environ.get("SEAL_CACHE_DIR") or None,
+                       disk_format=os.environ.get("SEAL_CACHE_FORMAT", "png"))
@@ -0,0 +1,361 @@
+# 界面与MCP服务使用的生成后端：按通道排队的进程池、临时文件目录、实时预览和指标服务
+import tempfile
+import atexit
+import heapq
+import itertools
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+# type: ignore
+from PIL import ImageFilter
+
+from .monitoring import metrics
+from .png import encode_image
+from .watermark import file_watermark_data
+from .render import seal_cache
+from .generator import key_registry, pool_context, SealGenerator
+
+class BackendBusy(Exception):
+    """生成后端的任务队列已满"""
+
+class RenderBackend:
+    """
+        印章生成后端：有界的优先级任务队列，由调度线程按优先级把任务交给进程池执行
+        lanes：通道名 -> (优先级, 队列上限)，优先级数值越小越先执行，各通道独立限制排队任务数
+        timeout：等待结果的默认超时（秒）；已开始执行的任务无法中断，超时后结果被丢弃
+    """
+
+    def __init__(self, workers=None, lanes=None, timeout=60):
+        self.workers = workers or os.cpu_count() or 1
+        self.lanes = lanes or {"ui": (0, 32), "mcp": (1, 32)}
+        self.timeout = timeout
+        self._queue = []
+        self._depth = {lane: 0 for lane in self.lanes}
+        self._running = 0
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._executor = None
+        self._dispatcher = None
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.restarts = 0
+
+    def submit(self, lane, fn, *args):
+        """把任务放入指定通道的队列，返回Future；队列已满时抛出BackendBusy"""
+        priority, limit = self.lanes[lane]
+        future = Future()
+        with self._cond:
+            if self._depth[lane] >= limit:
+                self.rejected += 1
+                raise BackendBusy(f"{lane} 队列已满（{limit}）")
+            self._depth[lane] += 1
+            heapq.heappush(self._queue, (priority, next(self._seq), lane, future, fn, args))
+            if self._dispatcher is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=pool_context())
+                self._dispatcher = threading.Thread(target=self._dispatch, name="render-dispatch", daemon=True)
+                self._dispatcher.start()
+            self._cond.notify_all()
+        return future
+
+    def run(self, lane, fn, *args, timeout=None):
+        """提交任务并等待结果，超时抛出 concurrent.futures.TimeoutError"""
+        future = self.submit(lane, fn, *args)
+        try:
+            return future.result(timeout=timeout or self.timeout)
+        except FuturesTimeoutError:
+            # 仍在排队的任务直接取消并释放队列名额，调度线程会跳过它
+            with self._cond:
+                self.timeouts += 1
+                if future.cancel():
+                    self._depth[lane] -= 1
+            raise
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                while not self._queue or self._running >= self.workers:
+                    self._cond.wait()
+                _, _, lane, future, fn, args = heapq.heappop(self._queue)
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self._depth[lane] -= 1
+                self._running += 1
+            executor = self._executor
+            try:
+                try:
+                    task = executor.submit(fn, *args)
+                except BrokenProcessPool:
+                    executor = self._replace_executor(executor)
+                    task = executor.submit(fn, *args)
+            except Exception as e:
+                self._finish(future, None, e)
+                continue
+            task.add_done_callback(lambda task, future=future, executor=executor: self._finish(future, task,
+                                                                                               executor=executor))
+
+    def _replace_executor(self, broken):
+        """工作进程异常退出（如被OOM终止）后进程池不可再用，换一个新的进程池；返回当前可用的进程池"""
+        with self._cond:
+            if self._executor is broken:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=pool_context())
+                self.restarts += 1
+            executor = self._executor
+        broken.shutdown(wait=False, cancel_futures=True)
+        return executor
+
+    def _finish(self, future, task, error=None, executor=None):
+        with self._cond:
+            self._running -= 1
+            self.completed += 1
+            self._cond.notify_all()
+        error = error or task.exception()
+        if isinstance(error, BrokenProcessPool) and executor is not None:
+            self._replace_executor(executor)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(task.result())
+
+    def stats(self):
+        """返回各通道排队数、执行中任务数和拒绝/超时统计"""
+        with self._cond:
+            return {
+                "queued": dict(self._depth),
+                "running": self._running,
+                "workers": self.workers,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "restarts": self.restarts,
+            }
+
+# 界面和MCP共用的生成后端，环境变量SEAL_WORKERS指定进程数，SEAL_TIMEOUT指定超时秒数
+render_backend = RenderBackend(workers=int(os.environ.get("SEAL_WORKERS", "0")) or None,
+                               timeout=float(os.environ.get("SEAL_TIMEOUT", "60")))
+
+class ScratchDir:
+    """
+        有界的临时文件目录：需要以文件形式交给界面的结果（图片、密钥）写在这里
+        文件超过ttl秒后由后台线程删除；总个数或总大小超限时立即删除最旧的文件；目录在首次写入时创建，退出时删除
+    """
+
+    def __init__(self, path=None, ttl=3600, max_files=1000, max_bytes=256 * 1024 * 1024, interval=60):
+        self.path = path  # None时在系统临时目录下创建
+        self.ttl = ttl  # 文件保留秒数
+        self.max_files = max_files  # 最多保留的文件个数
+        self.max_bytes = max_bytes  # 最多占用的字节数
+        self.interval = interval  # 后台清理的间隔秒数
+        self._files = OrderedDict()  # 文件路径 -> (写入时间, 大小)，按写入先后排列
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._cleaner = None
+        self.evictions = 0
+
+    def write(self, data, suffix=""):
+        """写入数据，返回文件路径"""
+        with self._lock:
+            if self._cleaner is None:
+                if self.path is None:
+                    self.path = tempfile.mkdtemp(prefix="seal-")
+                    atexit.register(shutil.rmtree, self.path, True)
+                else:
+                    os.makedirs(self.path, exist_ok=True)
+                self._cleaner = threading.Thread(target=self._run, name="scratch-cleanup", daemon=True)
+                self._cleaner.start()
+
+        fd, path = tempfile.mkstemp(suffix=suffix, dir=self.path)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+
+        with self._lock:
+            self._files[path] = (time.monotonic(), len(data))
+            self._bytes += len(data)
+            while len(self._files) > self.max_files or self._bytes > self.max_bytes:
+                self._remove_oldest()
+        return path
+
+    def cleanup(self):
+        """删除超过保留时间的文件"""
+        deadline = time.monotonic() - self.ttl
+        with self._lock:
+            while self._files and next(iter(self._files.values()))[0] < deadline:
+                self._remove_oldest()
+
+    def _remove_oldest(self):
+        path, (_, size) = self._files.popitem(last=False)
+        self._bytes -= size
+        self.evictions += 1
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.cleanup()
+
+    def stats(self):
+        """返回当前文件个数、占用字节数和删除次数"""
+        with self._lock:
+            return {"files": len(self._files), "bytes": self._bytes, "evictions": self.evictions}
+
+# 界面使用的临时文件目录，环境变量SEAL_SCRATCH_DIR指定位置，SEAL_SCRATCH_TTL指定保留秒数
+scratch_dir = ScratchDir(path=os.environ.get("SEAL_SCRATCH_DIR") or None,
+                         ttl=float(os.environ.get("SEAL_SCRATCH_TTL", "3600")))
+
+def generate_seal(company_name, bottom_text, size, enable_watermark, watermark_path, key_path, trace=False,
+                  watermark_version=None):
+    """
+        生成印章，返回 (PNG字节, 水印数据)；在生成后端的工作进程中执行，结果不落盘
+        trace：为True时在返回的水印数据中附加本次请求各阶段的耗时（trace字段）
+        watermark_version：水印格式版本，None时使用工作进程中SealGenerator.watermark_version的默认值；
+        工作进程不会看到调用方进程中对该属性的修改，需要兼容旧版验证程序时显式传入
+    """
+    if not trace:
+        return _generate_seal(company_name, bottom_text, size, enable_watermark, watermark_path, key_path,
+                              watermark_version)
+
+    start = time.perf_counter()
+    with metrics.trace() as stages:
+        png, watermark_data = _generate_seal(company_name, bottom_text, size, enable_watermark, watermark_path,
+                                             key_path, watermark_version)
+    watermark_data = dict(watermark_data)
+    watermark_data["trace"] = {
+        "pid": os.getpid(),
+        "total_ms": round((time.perf_counter() - start) * 1000, 3),
+        "stages": {name: {"count": count, "ms": round(seconds * 1000, 3)}
+                   for name, (count, seconds) in stages.items()},
+    }
+    return png, watermark_data
+
+def _generate_seal(company_name, bottom_text, size, enable_watermark, watermark_path, key_path, watermark_version):
+    # 初始化生成器（同一私钥复用已解析的生成器）
+    with metrics.stage("key_load"):
+        if key_path:
+            with open(key_path, "rb") as f:
+                generator = key_registry.get(f.read())
+        else:
+            generator = key_registry.ephemeral()
+    generator.seal_cache = seal_cache
+    if watermark_version is not None:
+        generator = generator.with_watermark_version(watermark_version)
+    
+    # 生成印章（缓存返回的是副本，后续嵌入水印不会影响缓存）
+    img = generator.create_seal(company_name, bottom_text, int(size))
+    
+    watermark_data = None
+    if enable_watermark:
+        # 处理签名文件
+        if watermark_path:
+            try:
+                watermark_data = file_watermark_data(company_name, watermark_path)
+            except Exception as e:
+                # 仍然返回未加水印的印章
+                return encode_image(img), {"error": f"文件读取失败: {str(e)}"}
+        
+        if watermark_data:
+            img = generator.add_watermark(img, watermark_data)
+        else:
+            watermark_data = {"error": "未提供水印内容"}
+    
+    return encode_image(img), watermark_data if watermark_data else {}
+
+class PreviewRenderer:
+    """
+        界面实时预览的增量绘制：圆圈、五角星和下圈文字组成的静态图层按参数缓存，
+        输入单位名称时只在静态图层的副本上重新粘贴上圈文字，文字图块复用字形缓存
+        fast为True时不做超采样和模糊，用于输入过程中的预览
+    """
+
+    def __init__(self, max_layers=32):
+        self.max_layers = max_layers  # 最多缓存的静态图层个数
+        self._layers = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, company_name, bottom_text, size=400, fast=True):
+        """返回预览图片（不含水印）"""
+        stamp = SealGenerator.make_stamp(company_name, bottom_text, int(size))
+        if fast:
+            stamp.supersample = 1
+        layout = stamp.layout()
+        top = len(stamp.words_up)
+
+        # make_stamp的其余参数都由size决定
+        key = (int(size), bottom_text, stamp.supersample)
+        with self._lock:
+            base = self._layers.get(key)
+            if base is not None:
+                self._layers.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if base is None:
+            base = stamp.draw_frame(layout)
+            stamp.draw_glyphs(base, layout, top)
+            with self._lock:
+                self._layers[key] = base
+                while len(self._layers) > self.max_layers:
+                    self._layers.popitem(last=False)
+
+        img = base.copy()
+        stamp.draw_glyphs(img, layout, 0, top)
+        if not fast:
+            with metrics.stage("blur"):
+                img = img.filter(ImageFilter.GaussianBlur(stamp.blur_radius))
+        return img
+
+    def stats(self):
+        """返回静态图层缓存的命中统计"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "layers": len(self._layers)}
+
+preview_renderer = PreviewRenderer()
+
+def prometheus_metrics():
+    """Prometheus文本格式的全部指标：各阶段耗时和生成后端队列状态"""
+    stats = render_backend.stats()
+    lines = ["# HELP seal_backend_queued 生成后端各通道排队的任务数",
+             "# TYPE seal_backend_queued gauge"]
+    for lane, depth in stats["queued"].items():
+        lines.append(f'seal_backend_queued{{lane="{lane}"}} {depth}')
+    lines += ["# HELP seal_backend_running 正在执行的生成任务数",
+              "# TYPE seal_backend_running gauge",
+              f"seal_backend_running {stats['running']}"]
+    for name, help_text in (("completed", "已完成的生成任务数"), ("rejected", "队列已满被拒绝的任务数"),
+                            ("timeouts", "等待超时的任务数")):
+        lines += [f"# HELP seal_backend_{name}_total {help_text}",
+                  f"# TYPE seal_backend_{name}_total counter",
+                  f"seal_backend_{name}_total {stats[name]}"]
+    return metrics.prometheus() + "\n".join(lines) + "\n"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_metrics().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """在后台线程中启动HTTP服务，在 /metrics 提供Prometheus格式的指标，并启用指标统计"""
+    metrics.enabled = True
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,262 @@
+# 水印格式：嵌入、提取、解析和签名验证，以及水印数据中的文件哈希
+import hashlib
+import base64
+import json
+import io
+import struct
+import zlib
+from functools import lru_cache
+import numpy as np
+# type: ignore
+from PIL import Image
+# type: ignore
+from cryptography.hazmat.primitives import hashes
+# type: ignore
+from cryptography.hazmat.primitives.asymmetric import ec
+# type: ignore
+from cryptography.hazmat.primitives import serialization
+# type: ignore
+from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+
+from .monitoring import metrics
+from .png import _png_head_pixels
+
+# 水印格式：前32个像素红色通道的最低位存数据长度，之后的RGB最低位存数据
+# 新生成的水印数据以 魔数 + 版本号 开头，旧版水印直接以JSON的"{"开头
+# 版本1：JSON文本 {"data", "signature"（base64的DER签名）, "public_key"（PEM公钥）}
+# 版本2：紧凑的二进制格式，见 WATERMARK_BINARY_HEAD
+WATERMARK_MAGIC = b"RSW"
+WATERMARK_VERSION_LEGACY = 0  # 不带魔数的JSON文本（与版本1内容相同），旧版验证程序只能读取这种格式
+WATERMARK_VERSION_JSON = 1
+WATERMARK_VERSION_BINARY = 2
+WATERMARK_HEADER_PIXELS = 32  # 存储长度的像素数
+WATERMARK_PROBE_PIXELS = WATERMARK_HEADER_PIXELS + 11  # 读取长度和4字节前缀所需的像素数
+
+# 版本2的固定部分（大端）：公钥格式、公钥、签名r||s、文件大小、文件SHA-256、签发时间长度、签发单位长度，
+# 之后依次是签发时间和签发单位的UTF-8文本
+WATERMARK_BINARY_HEAD = struct.Struct(">B33s64sQ32sBH")
+WATERMARK_KEY_P256 = 1  # 公钥格式：SECP256R1压缩点，33字节
+
+def watermark_pixels(length):
+    """嵌入length字节的水印需要改动的像素数（从第一个像素开始）"""
+    return WATERMARK_HEADER_PIXELS + -(-length * 8 // 3)
+
+def watermark_capacity(pixel_count):
+    """pixel_count个像素的图片最多能嵌入的水印字节数"""
+    return max(pixel_count - WATERMARK_HEADER_PIXELS, 0) * 3 // 8
+
+def embed_watermark_array(arr, watermark_bytes):
+    """把水印数据写入RGB(A)像素数组（原地修改），图片容量不足时抛出ValueError"""
+    # 按RGB平面整体操作像素，格式与逐像素写入完全一致
+    flat = arr.reshape(-1, arr.shape[-1])
+    if len(watermark_bytes) > watermark_capacity(len(flat)):
+        raise ValueError(f"图片容量不足：水印需要 {watermark_pixels(len(watermark_bytes))} 个像素，"
+                         f"图片只有 {len(flat)} 个")
+
+    # 在前32个像素的红色通道存储数据长度（低位在前）
+    length = len(watermark_bytes)
+    count = min(WATERMARK_HEADER_PIXELS, len(flat))
+    length_bits = (length >> np.arange(count)) & 1
+    flat[:count, 0] = (flat[:count, 0] & 0xFE) | length_bits
+
+    # 嵌入水印数据，每个字节低位在前，依次写入后续像素的R、G、B通道
+    bits = np.unpackbits(np.frombuffer(watermark_bytes, dtype=np.uint8), bitorder="little")
+    bits = bits[:max(len(flat) - WATERMARK_HEADER_PIXELS, 0) * 3]
+    pixel_count = -(-len(bits) // 3)
+    channels = flat[WATERMARK_HEADER_PIXELS:WATERMARK_HEADER_PIXELS + pixel_count, :3].reshape(-1)
+    channels[:len(bits)] = (channels[:len(bits)] & 0xFE) | bits
+    flat[WATERMARK_HEADER_PIXELS:WATERMARK_HEADER_PIXELS + pixel_count, :3] = channels.reshape(-1, 3)
+    return arr
+
+HASH_CHUNK_SIZE = 1024 * 1024  # 文件哈希每次读取的字节数
+
+def hash_file(path, chunk_size=HASH_CHUNK_SIZE):
+    """分块计算文件的SHA-256，返回 (十六进制摘要, 文件大小)，内存占用与文件大小无关"""
+    with open(path, "rb", buffering=0) as f:
+        return hash_stream(f, chunk_size)
+
+def hash_stream(f, chunk_size=HASH_CHUNK_SIZE):
+    """分块计算已打开的二进制文件对象（如zip中的文件）的SHA-256，返回 (十六进制摘要, 大小)"""
+    digest = hashlib.sha256()
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    size = 0
+    with metrics.stage("hash"):
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            digest.update(view[:n])
+            size += n
+    return digest.hexdigest(), size
+
+def make_watermark_data(company_name, file_hash, file_size):
+    """构建水印数据"""
+    return {
+        "issuer": company_name,
+        "timestamp": "2025-08-20",
+        "file_hash": file_hash,
+        "file_size": file_size
+    }
+
+def file_watermark_data(company_name, path):
+    """计算文件哈希并构建水印数据，空文件返回None"""
+    file_hash, file_size = hash_file(path)
+    if not file_size:
+        return None
+    return make_watermark_data(company_name, file_hash, file_size)
+
+def extract_watermark_bytes(img):
+    """从图片像素的最低位中提取水印数据"""
+    if img.mode not in ("RGB", "RGBA"):
+        raise ValueError(f"不支持的图片模式: {img.mode}")
+    arr = np.asarray(img)
+    flat = arr.reshape(-1, arr.shape[-1])
+
+    # 提取水印长度
+    count = min(32, len(flat))
+    length = int(((flat[:count, 0] & 1).astype(np.uint64) << np.arange(count, dtype=np.uint64)).sum())
+
+    # 提取水印数据，超出图片容量的部分截断
+    bits = flat[32:32 + -(-length * 8 // 3), :3].reshape(-1)[:length * 8] & 1
+    return np.packbits(bits, bitorder="little").tobytes()
+
+def is_binary_watermark_data(data):
+    """水印数据能否无损地用二进制格式表示（即make_watermark_data构建的数据）"""
+    try:
+        return (set(data) == {"issuer", "timestamp", "file_hash", "file_size"}
+                and isinstance(data["issuer"], str) and len(data["issuer"].encode()) <= 0xFFFF
+                and isinstance(data["timestamp"], str) and len(data["timestamp"].encode()) <= 0xFF
+                and isinstance(data["file_hash"], str) and len(data["file_hash"]) == 64
+                and bytes.fromhex(data["file_hash"]).hex() == data["file_hash"]
+                and type(data["file_size"]) is int and 0 <= data["file_size"] < 1 << 64)
+    except (TypeError, ValueError):
+        return False
+
+def decode_watermark(watermark_bytes):
+    """
+        解析水印数据，返回 {"data": 水印数据, "signature": DER签名, "public_key": 公钥对象}
+        支持二进制格式、带魔数的JSON格式以及不带魔数的旧版JSON水印
+    """
+    if watermark_bytes.startswith(WATERMARK_MAGIC):
+        version = watermark_bytes[len(WATERMARK_MAGIC)]
+        body = watermark_bytes[len(WATERMARK_MAGIC) + 1:]
+        if version == WATERMARK_VERSION_BINARY:
+            return _decode_binary_watermark(body)
+        if version != WATERMARK_VERSION_JSON:
+            raise ValueError(f"不支持的水印版本: {version}")
+        watermark_bytes = body
+    watermark = json.loads(watermark_bytes.decode())
+    return {
+        "data": watermark["data"],
+        "signature": base64.b64decode(watermark["signature"]),
+        "public_key": load_public_key(watermark["public_key"]),
+    }
+
+def _decode_binary_watermark(body):
+    key_format, point, signature, file_size, file_hash, timestamp_length, issuer_length = \
+        WATERMARK_BINARY_HEAD.unpack_from(body)
+    if key_format != WATERMARK_KEY_P256:
+        raise ValueError(f"不支持的公钥格式: {key_format}")
+    offset = WATERMARK_BINARY_HEAD.size
+    if len(body) != offset + timestamp_length + issuer_length:
+        raise ValueError("水印长度与内容不符")
+    timestamp = body[offset:offset + timestamp_length].decode()
+    issuer = body[offset + timestamp_length:].decode()
+    return {
+        "data": {"issuer": issuer, "timestamp": timestamp, "file_hash": file_hash.hex(), "file_size": file_size},
+        "signature": encode_dss_signature(int.from_bytes(signature[:32], "big"),
+                                          int.from_bytes(signature[32:], "big")),
+        "public_key": load_point_public_key(point),
+    }
+
+def check_watermark_header(head, pixel_count):
+    """
+        根据图片开头 WATERMARK_PROBE_PIXELS 个像素检查水印头，pixel_count为图片总像素数
+        可能带有水印时返回None，否则返回 verify_seal 格式的结果字典
+    """
+    if pixel_count < WATERMARK_PROBE_PIXELS or len(head) < WATERMARK_PROBE_PIXELS:
+        return {"status": "no_watermark", "data": None, "error": "图片太小，未检测到水印"}
+
+    head = np.asarray(head)
+    lsb = head[:WATERMARK_HEADER_PIXELS, 0] & 1
+    length = int((lsb.astype(np.uint64) << np.arange(WATERMARK_HEADER_PIXELS, dtype=np.uint64)).sum())
+    bits = head[WATERMARK_HEADER_PIXELS:WATERMARK_PROBE_PIXELS, :3].reshape(-1)[:32] & 1
+    prefix = np.packbits(bits, bitorder="little").tobytes()
+
+    # 长度必须在图片容量之内
+    capacity = watermark_capacity(pixel_count)
+    if prefix.startswith(WATERMARK_MAGIC):
+        if length <= len(WATERMARK_MAGIC) + 1:
+            return {"status": "corrupt", "data": None, "error": "水印数据损坏: 长度无效"}
+        if length > capacity:
+            return {"status": "corrupt", "data": None, "error": "水印长度超出图片容量，图片可能被截断"}
+        return None
+    if prefix.startswith(b"{") and 0 < length <= capacity:
+        return None
+    return {"status": "no_watermark", "data": None, "error": "未检测到水印"}
+
+def probe_watermark(img):
+    """只读取图片开头的几个像素检查水印头，返回值同 check_watermark_header"""
+    if img.mode not in ("RGB", "RGBA"):
+        return {"status": "no_watermark", "data": None, "error": f"不支持的图片模式: {img.mode}"}
+    width, height = img.size
+    rows = min(-(-WATERMARK_PROBE_PIXELS // max(width, 1)), height)
+    head = np.asarray(img.crop((0, 0, width, rows))).reshape(-1, len(img.getbands()))
+    return check_watermark_header(head[:WATERMARK_PROBE_PIXELS], width * height)
+
+@lru_cache(maxsize=1024)
+def load_public_key(pem):
+    """解析PEM格式的公钥，按PEM内容缓存解析结果"""
+    return serialization.load_pem_public_key(pem.encode())
+
+@lru_cache(maxsize=1024)
+def load_point_public_key(point):
+    """解析SECP256R1压缩点格式的公钥，按内容缓存解析结果"""
+    return ec.EllipticCurvePublicKey.from_encoded_point(ec.SECP256R1(), point)
+
+def verify_seal(img):
+    """
+        验证图片中嵌入的水印签名，返回字典 {"status", "data", "error"}
+        status：valid 签名有效，invalid 签名无效，corrupt 水印数据损坏，no_watermark 未检测到水印
+    """
+    # 先只检查水印头，没有水印或长度不合法的图片不做完整提取
+    rejected = probe_watermark(img)
+    if rejected is not None:
+        return rejected
+
+    try:
+        watermark = decode_watermark(extract_watermark_bytes(img))
+        public_key = watermark['public_key']
+        data = json.dumps(watermark['data'], sort_keys=True)
+        signature = watermark['signature']
+    except Exception as e:
+        return {"status": "corrupt", "data": None, "error": f"水印数据损坏: {e}"}
+
+    # 验证签名
+    try:
+        public_key.verify(
+            signature,
+            data.encode(),
+            ec.ECDSA(hashes.SHA256())
+        )
+    except Exception:
+        return {"status": "invalid", "data": watermark['data'], "error": "数字签名无效"}
+    return {"status": "valid", "data": watermark['data'], "error": None}
+
+def verify_seal_file(source):
+    """验证图片文件（路径或字节），PNG文件先解析开头像素检查水印头，不带水印时不解码整张图片"""
+    with (io.BytesIO(source) if isinstance(source, bytes) else open(source, "rb")) as fp:
+        try:
+            probe = _png_head_pixels(fp, WATERMARK_PROBE_PIXELS)
+        except (struct.error, zlib.error, IndexError):
+            probe = None
+        if probe is not None:
+            width, height, head = probe
+            rejected = check_watermark_header(head, width * height)
+            if rejected is not None:
+                return rejected
+
+        fp.seek(0)
+        with Image.open(fp) as img:
+            return verify_seal(img)
@@ -0,0 +1,72 @@
+# 用同一个印章批量签名文件命令行工具
+#
+# 用法：
+#   python sign.py "某某有限公司" invoices_dir -o signed_dir --key private.pem
+#   python sign.py "某某有限公司" invoices.zip -o signed.zip --bottom-text 1234567890 --workers 8
+#
+# 印章只绘制一次，每个文件分块计算哈希后签名，水印嵌入印章副本，输出为与文件同名的 <文件名>.png，
+# 以及逐条结果清单manifest.jsonl（失败项记录错误信息）
+import argparse
+import json
+import sys
+
+from cryptography.hazmat.primitives import serialization
+
+from seal_core import SealGenerator, sign_documents
+from batch import DirWriter, ZipWriter
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="用同一个红章批量签名文件")
+    parser.add_argument("company_name", help="单位名称")
+    parser.add_argument("source", help="待签名文件所在目录（递归），或zip文件")
+    parser.add_argument("-o", "--output", required=True, help="输出目录，或以.zip结尾的zip文件")
+    parser.add_argument("--bottom-text", default="", help="印章底部文字")
+    parser.add_argument("--size", type=int, default=400, help="印章尺寸")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="签名进程数，默认CPU核数")
+    parser.add_argument("--hash-workers", type=int, default=4, help="并发计算文件哈希的线程数")
+    parser.add_argument("--unordered", action="store_true", help="按完成先后输出，不保持输入顺序")
+    parser.add_argument("--key", help="PEM格式私钥文件，不指定时生成新密钥")
+    args = parser.parse_args(argv)
+
+    if args.key:
+        with open(args.key, "rb") as f:
+            generator = SealGenerator(serialization.load_pem_private_key(f.read(), password=None))
+    else:
+        generator = SealGenerator()
+
+    if args.output.lower().endswith(".zip"):
+        writer = ZipWriter(args.output)
+    else:
+        writer = DirWriter(args.output)
+
+    manifest = []
+    failed = 0
+    try:
+        results = sign_documents(generator, args.company_name, args.bottom_text, args.source, size=args.size,
+                                 workers=args.workers, hash_workers=args.hash_workers, ordered=not args.unordered)
+        for result in results:
+            entry = {
+                "index": result["index"],
+                "document": result["document"],
+                "file": None,
+                "watermark_data": result["watermark_data"],
+                "error": result["error"],
+            }
+            if result["error"]:
+                failed += 1
+                print(f"[{result['index']}] {result['document']} 失败: {result['error']}", file=sys.stderr)
+            else:
+                entry["file"] = result["document"] + ".png"
+                writer.write(entry["file"], result["data"])
+            manifest.append(json.dumps(entry, ensure_ascii=False))
+        writer.write("manifest.jsonl", ("\n".join(manifest) + "\n").encode())
+    finally:
+        writer.close()
+
+    print(f"完成：成功 {len(manifest) - failed}，失败 {failed}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
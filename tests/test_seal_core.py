@@ -0,0 +1,464 @@
+# 回归测试：水印的向量化实现与原逐像素实现逐字节一致、各版本水印格式的解析，以及字形绘制与原实现的像素误差
+import base64
+import io
+import json
+import struct
+import zlib
+import zipfile
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+from seal_core import (WATERMARK_MAGIC, WATERMARK_PROBE_PIXELS, WATERMARK_VERSION_BINARY, WATERMARK_VERSION_JSON,
+                       WATERMARK_VERSION_LEGACY, PngTemplate, RenderBackend, SealGenerator, check_watermark_header,
+                       decode_watermark, embed_watermark_array, encode_image, extract_watermark_bytes, font_path,
+                       generate_seal, make_watermark_data, sign_documents, verify_seal, verify_seal_file,
+                       watermark_capacity)
+from seal_core.png import _png_head_pixels
+
+
+# ---- 原实现（逐像素），冻结的副本，仅用于比较 ----
+
+def legacy_embed(image, watermark_bytes):
+    pixels = list(image.getdata())
+    length = len(watermark_bytes)
+    for i in range(32):
+        if i < len(pixels):
+            r, g, b, a = pixels[i]
+            r = (r & 0xFE) | ((length >> i) & 1)
+            pixels[i] = (r, g, b, a)
+
+    bit_index = 0
+    for byte in watermark_bytes:
+        for bit_pos in range(8):
+            pixel_index = 32 + bit_index // 3
+            if pixel_index >= len(pixels):
+                break
+            channel = bit_index % 3
+            bit = (byte >> bit_pos) & 1
+            r, g, b, a = pixels[pixel_index]
+            if channel == 0:
+                r = (r & 0xFE) | bit
+            elif channel == 1:
+                g = (g & 0xFE) | bit
+            else:
+                b = (b & 0xFE) | bit
+            pixels[pixel_index] = (r, g, b, a)
+            bit_index += 1
+
+    image.putdata(pixels)
+    return image
+
+
+def legacy_extract(img):
+    pixels = list(img.getdata())
+    length = 0
+    for i in range(32):
+        if i < len(pixels):
+            length |= (pixels[i][0] & 1) << i
+
+    watermark_bytes = bytearray()
+    bit_index = 0
+    for _ in range(length * 8):
+        pixel_index = 32 + bit_index // 3
+        if pixel_index >= len(pixels):
+            break
+        channel = bit_index % 3
+        bit = pixels[pixel_index][channel] & 1
+        if bit_index % 8 == 0:
+            watermark_bytes.append(0)
+        watermark_bytes[-1] |= (bit << (bit_index % 8))
+        bit_index += 1
+    return bytes(watermark_bytes)
+
+
+def legacy_draw_rotated_text(image, angle, xy, r, word, fill, font_size, font_xratio, stroke_width, font_flip=False):
+    font = ImageFont.truetype(font_path("arialr.ttf"), font_size, encoding="utf-8")
+    width, height = image.size
+    max_dim = max(width, height)
+    mask_size = (max_dim * 2, max_dim * 2)
+    mask_resize = (int(max_dim * 2 * font_xratio), max_dim * 2)
+    mask = Image.new('L', mask_size, 0)
+    draw = ImageDraw.Draw(mask)
+    bd = draw.textbbox((max_dim, max_dim), word, font=font, align="center")
+    font_width = bd[2] - bd[0]
+    font_hight = bd[3] - bd[1]
+    if font_flip:
+        word_pos = (int(max_dim - font_width / 2), max_dim + r - font_hight)
+    else:
+        word_pos = (int(max_dim - font_width / 2), max_dim - r)
+    draw.text(word_pos, word, 255, font=font, align="center", stroke_width=stroke_width)
+    if angle % 90 == 0:
+        rotated_mask = mask.resize(mask_resize).rotate(angle)
+    else:
+        bigger_mask = mask.resize((int(max_dim * 8 * font_xratio), max_dim * 8), resample=Image.BICUBIC)
+        rotated_mask = bigger_mask.rotate(angle).resize(mask_resize, resample=Image.LANCZOS)
+    mask_xy = (max_dim * font_xratio - xy[0], max_dim - xy[1])
+    mask = rotated_mask.crop(mask_xy + (mask_xy[0] + width, mask_xy[1] + height))
+    image.paste(Image.new('RGBA', image.size, fill), mask)
+
+
+def random_image(rng, width, height):
+    return Image.fromarray(rng.integers(0, 256, (height, width, 4), dtype=np.uint8), "RGBA")
+
+
+# ---- 水印嵌入与提取 ----
+
+@pytest.mark.parametrize("width,height,length", [(3, 3, 0), (12, 12, 10), (40, 40, 100), (120, 97, 600),
+                                                 (276, 276, 700)])
+def test_embed_matches_legacy(width, height, length):
+    rng = np.random.default_rng(width * 1000 + length)
+    img = random_image(rng, width, height)
+    payload = rng.integers(0, 256, length, dtype=np.uint8).tobytes()
+
+    expected = legacy_embed(img.copy(), payload)
+    actual = embed_watermark_array(np.array(img), payload)
+    assert actual.tobytes() == expected.tobytes()
+    assert extract_watermark_bytes(Image.fromarray(actual, "RGBA")) == legacy_extract(expected) == payload
+
+
+def test_extract_matches_legacy_on_random_images():
+    rng = np.random.default_rng(1)
+    for size in (3, 16, 50, 101):
+        img = random_image(rng, size, size)
+        # 长度头只取低位，避免随机图片声明过长的数据
+        arr = np.array(img)
+        arr.reshape(-1, 4)[8:32, 0] &= 0xFE
+        img = Image.fromarray(arr, "RGBA")
+        assert extract_watermark_bytes(img) == legacy_extract(img)
+
+
+def test_truncated_payload():
+    """原实现在图片容量不足时截断写入；现在嵌入前报错，但截断的旧图片仍按原方式提取"""
+    rng = np.random.default_rng(2)
+    img = random_image(rng, 20, 20)
+    payload = rng.integers(0, 256, watermark_capacity(400) + 50, dtype=np.uint8).tobytes()
+
+    with pytest.raises(ValueError):
+        embed_watermark_array(np.array(img), payload)
+
+    truncated = legacy_embed(img.copy(), payload)
+    assert extract_watermark_bytes(truncated) == legacy_extract(truncated)
+    assert payload.startswith(extract_watermark_bytes(truncated)[:-1])
+
+
+# ---- 水印格式 ----
+
+@pytest.fixture(scope="module")
+def generator():
+    return SealGenerator()
+
+
+@pytest.fixture(scope="module")
+def seal(generator):
+    return generator.create_seal("ACME TRADING", "1234567890", 200)
+
+
+@pytest.mark.parametrize("version,prefix", [(WATERMARK_VERSION_BINARY, WATERMARK_MAGIC + b"\x02"),
+                                            (WATERMARK_VERSION_JSON, WATERMARK_MAGIC + b"\x01"),
+                                            (WATERMARK_VERSION_LEGACY, b"{")])
+def test_watermark_versions_verify(generator, seal, version, prefix):
+    data = make_watermark_data("ACME TRADING", "ab" * 32, 4096)
+    signer = SealGenerator(generator.private_key)
+    signer.watermark_version = version
+    img = signer.add_watermark(seal.copy(), data)
+
+    raw = extract_watermark_bytes(img)
+    assert raw.startswith(prefix)
+    watermark = decode_watermark(raw)
+    assert watermark["data"] == data
+    assert verify_seal(img) == {"status": "valid", "data": data, "error": None}
+
+
+def test_binary_watermark_is_compact(generator):
+    data = make_watermark_data("ACME TRADING", "ab" * 32, 4096)
+    json_generator = SealGenerator(generator.private_key)
+    json_generator.watermark_version = WATERMARK_VERSION_JSON
+    assert len(generator.watermark_payload(data)) < len(json_generator.watermark_payload(data)) // 2
+
+
+def test_non_schema_data_falls_back_to_json(generator):
+    assert generator.watermark_payload({"note": "x"}).startswith(WATERMARK_MAGIC + b"\x01")
+
+
+def test_legacy_json_without_magic(generator, seal):
+    """最早的水印：JSON文本，没有魔数和版本号"""
+    data = make_watermark_data("ACME TRADING", "cd" * 32, 10)
+    signature = generator._generate_signature(json.dumps(data, sort_keys=True))
+    raw = json.dumps({"data": data, "signature": signature, "public_key": generator.public_key_pem}).encode()
+    img = Image.fromarray(embed_watermark_array(np.array(seal), raw), "RGBA")
+    assert verify_seal(img)["status"] == "valid"
+
+    forged = dict(data, file_size=11)
+    raw = json.dumps({"data": forged, "signature": signature, "public_key": generator.public_key_pem}).encode()
+    img = Image.fromarray(embed_watermark_array(np.array(seal), raw), "RGBA")
+    assert verify_seal(img)["status"] == "invalid"
+
+
+def test_tampered_binary_watermark(generator, seal):
+    img = generator.add_watermark(seal.copy(), make_watermark_data("ACME TRADING", "ab" * 32, 4096))
+    # 第150个像素落在签名r||s中，改动公钥所在的像素则可能得到无效的曲线点（corrupt）
+    arr = np.array(img)
+    arr.reshape(-1, 4)[150, 1] ^= 1
+    assert verify_seal(Image.fromarray(arr, "RGBA"))["status"] == "invalid"
+    # 文件大小字段
+    arr = np.array(img)
+    arr.reshape(-1, 4)[32 + (4 + 1 + 33 + 64) * 8 // 3, 0] ^= 1
+    assert verify_seal(Image.fromarray(arr, "RGBA"))["status"] == "invalid"
+
+
+@pytest.fixture()
+def legacy_generator(generator):
+    signer = SealGenerator(generator.private_key)
+    signer.watermark_version = WATERMARK_VERSION_LEGACY
+    return signer
+
+
+def test_create_seals_keeps_watermark_version_in_workers(legacy_generator, tmp_path):
+    document = tmp_path / "a.txt"
+    document.write_bytes(b"x" * 100)
+    specs = [{"company_name": "ACME", "bottom_text": str(i), "size": 100, "document": str(document)} for i in range(3)]
+    results = list(legacy_generator.create_seals(specs, workers=2, image_format="PNG"))
+    for result in results:
+        assert result["error"] is None
+        img = Image.open(io.BytesIO(result["data"]))
+        assert extract_watermark_bytes(img).startswith(b'{"data"')
+        assert verify_seal(img)["status"] == "valid"
+
+
+def test_sign_documents_keeps_watermark_version_in_workers(legacy_generator, tmp_path):
+    paths = []
+    for i in range(3):
+        paths.append(tmp_path / f"{i}.txt")
+        paths[-1].write_bytes(b"y" * (i + 1))
+    results = list(sign_documents(legacy_generator, "ACME", "1", [str(p) for p in paths], size=100, workers=2))
+    for result in results:
+        assert result["error"] is None
+        img = Image.open(io.BytesIO(result["data"]))
+        assert extract_watermark_bytes(img).startswith(b'{"data"')
+        assert verify_seal(img)["status"] == "valid"
+
+
+def test_sign_documents_path_list_names(generator, tmp_path, monkeypatch):
+    """文件路径列表可以含..或为绝对路径，输出名称相对于共同上级目录，重名时加序号"""
+    (tmp_path / "work").mkdir()
+    (tmp_path / "a.txt").write_bytes(b"a")
+    (tmp_path / "work" / "a.txt").write_bytes(b"b")
+    monkeypatch.chdir(tmp_path / "work")
+    sources = ["../a.txt", "a.txt", str(tmp_path / "a.txt")]
+    results = list(sign_documents(generator, "ACME", "1", sources, size=60, workers=1))
+    assert [result["error"] for result in results] == [None] * 3
+    assert [result["document"] for result in results] == ["a.txt", "work/a.txt", "a (2).txt"]
+
+
+def test_sign_documents_rejects_unsafe_zip_members(generator, tmp_path):
+    archive = tmp_path / "docs.zip"
+    with zipfile.ZipFile(archive, "w") as z:
+        z.writestr("../evil.txt", b"x")
+        z.writestr("/abs.txt", b"y")
+        z.writestr("ok/b.txt", b"z")
+    results = list(sign_documents(generator, "ACME", "1", str(archive), size=60, workers=1))
+    assert "不安全的文件名" in results[0]["error"]
+    assert [(result["document"], result["error"]) for result in results[1:]] == [("abs.txt", None), ("ok/b.txt", None)]
+
+
+def test_render_backend_passes_watermark_version(tmp_path):
+    document = tmp_path / "a.txt"
+    document.write_bytes(b"z" * 10)
+    backend = RenderBackend(workers=1)
+    try:
+        png, data = backend.run("ui", generate_seal, "ACME", "1", 100, True, str(document), None, False,
+                                WATERMARK_VERSION_LEGACY)
+    finally:
+        if backend._executor is not None:
+            backend._executor.shutdown()
+    img = Image.open(io.BytesIO(png))
+    assert extract_watermark_bytes(img).startswith(b'{"data"')
+    assert verify_seal(img) == {"status": "valid", "data": data, "error": None}
+
+
+def test_unknown_version_rejected():
+    with pytest.raises(ValueError):
+        decode_watermark(WATERMARK_MAGIC + b"\x09" + base64.b64encode(b"x"))
+
+
+# ---- PNG开头像素的解析和水印头检查 ----
+
+def encode_png(arr, filters, chunk_size=None):
+    """按指定的滤波类型（逐行循环使用）编码8位RGB/RGBA的PNG，chunk_size指定时把数据拆成多个IDAT"""
+    height, width, bpp = arr.shape
+    raw = bytearray()
+    prev = [0] * (width * bpp)
+    for y in range(height):
+        line = arr[y].reshape(-1).tolist()
+        filter_type = filters[y % len(filters)]
+        raw.append(filter_type)
+        for i, x in enumerate(line):
+            a = line[i - bpp] if i >= bpp else 0
+            b = prev[i]
+            c = prev[i - bpp] if i >= bpp else 0
+            if filter_type == 0:
+                predictor = 0
+            elif filter_type == 1:
+                predictor = a
+            elif filter_type == 2:
+                predictor = b
+            elif filter_type == 3:
+                predictor = (a + b) >> 1
+            else:
+                p = a + b - c
+                pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                predictor = a if pa <= pb and pa <= pc else (b if pb <= pc else c)
+            raw.append((x - predictor) & 0xFF)
+        prev = line
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    data = zlib.compress(bytes(raw))
+    chunk_size = chunk_size or len(data)
+    idat = b"".join(chunk(b"IDAT", data[i:i + chunk_size]) for i in range(0, len(data), chunk_size))
+    color = 2 if bpp == 3 else 6
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color, 0, 0, 0))
+            + chunk(b"tEXt", b"Comment\x00x") + idat + chunk(b"IEND", b""))
+
+
+def assert_head_matches_pillow(png):
+    with Image.open(io.BytesIO(png)) as img:
+        expected = np.asarray(img).reshape(-1, len(img.getbands()))
+        size = img.size
+    width, height, head = _png_head_pixels(io.BytesIO(png), WATERMARK_PROBE_PIXELS)
+    assert (width, height) == size
+    assert np.array_equal(head, expected[:WATERMARK_PROBE_PIXELS])
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA"])
+@pytest.mark.parametrize("width,height", [(1, 50), (5, 12), (20, 4), (42, 3), (60, 2)])
+@pytest.mark.parametrize("filters", [[0], [1], [2], [3], [4], [0, 1, 2, 3, 4], [4, 3, 2, 1, 0]])
+def test_png_head_pixels_filters(mode, width, height, filters):
+    rng = np.random.default_rng(width * 100 + height)
+    arr = rng.integers(0, 256, (height, width, len(mode)), dtype=np.uint8)
+    png = encode_png(arr, filters, chunk_size=7)
+    # 测试用的编码器本身由Pillow核对
+    assert np.array_equal(np.asarray(Image.open(io.BytesIO(png))), arr)
+    assert_head_matches_pillow(png)
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA"])
+@pytest.mark.parametrize("options", [{"compress_level": 0}, {"compress_level": 1}, {"compress_level": 9},
+                                     {"optimize": True}])
+def test_png_head_pixels_pillow_encoded(seal, mode, options):
+    for width in (7, 42, 200):
+        img = seal.resize((width, width)).convert(mode)
+        buf = io.BytesIO()
+        img.save(buf, format="PNG", **options)
+        assert_head_matches_pillow(buf.getvalue())
+
+
+def test_png_head_pixels_unsupported():
+    for img in (Image.new("L", (50, 50)), Image.new("P", (50, 50)), Image.new("RGBA", (50, 50)).convert("LA")):
+        buf = io.BytesIO()
+        img.save(buf, format="PNG")
+        assert _png_head_pixels(io.BytesIO(buf.getvalue()), WATERMARK_PROBE_PIXELS) is None
+    assert _png_head_pixels(io.BytesIO(b"GIF89a"), WATERMARK_PROBE_PIXELS) is None
+
+
+def probe_png(png):
+    width, height, head = _png_head_pixels(io.BytesIO(png), WATERMARK_PROBE_PIXELS)
+    return check_watermark_header(head, width * height)
+
+
+def test_probe_without_watermark(seal):
+    png = encode_image(seal)
+    assert probe_png(png)["status"] == "no_watermark"
+    assert verify_seal_file(png)["status"] == "no_watermark"
+
+
+def test_probe_legacy_watermark(seal, legacy_generator):
+    img = legacy_generator.add_watermark(seal.copy(), make_watermark_data("ACME TRADING", "ef" * 32, 5))
+    png = encode_image(img)
+    assert probe_png(png) is None
+    assert verify_seal_file(png)["status"] == "valid"
+
+
+def test_probe_truncated_after_magic(generator, seal):
+    """图片在魔数之后被截断（只保留开头几行），水印长度超出剩余像素的容量"""
+    img = generator.add_watermark(seal.copy(), make_watermark_data("ACME TRADING", "ab" * 32, 4096))
+    truncated = img.crop((0, 0, img.width, 1))
+    assert watermark_capacity(img.width) < len(extract_watermark_bytes(img))
+    assert extract_watermark_bytes(truncated).startswith(WATERMARK_MAGIC + b"\x02")
+    png = encode_image(truncated)
+    assert probe_png(png)["status"] == "corrupt"
+    assert verify_seal_file(png)["status"] == "corrupt"
+    assert verify_seal(truncated)["status"] == "corrupt"
+
+
+# ---- PNG模板 ----
+
+@pytest.mark.parametrize("width,height", [(1, 1), (5, 3), (3, 17), (37, 20), (64, 64)])
+@pytest.mark.parametrize("compress_level", [0, 6, 9])
+def test_png_template_decodes_to_source(width, height, compress_level):
+    """前rows行可以是任意像素，rows从1到整张图的高度（后缀为空）"""
+    rng = np.random.default_rng(width * height + compress_level)
+    # 随机像素和大片相同像素各占一半，压缩后既有字面量也有长匹配
+    base = rng.integers(0, 256, (height, width, 4), dtype=np.uint8)
+    base[height // 2:] = base[height // 2:, :1]
+    for rows in range(1, height + 1):
+        template = PngTemplate(base, rows, compress_level)
+        prefix = rng.integers(0, 256, (rows, width, 4), dtype=np.uint8)
+        expected = base.copy()
+        expected[:rows] = prefix
+        img = Image.open(io.BytesIO(template.encode(prefix)))
+        assert img.mode == "RGBA" and img.size == (width, height)
+        assert np.array_equal(np.asarray(img), expected)
+
+
+def test_png_template_rows_beyond_height():
+    base = np.zeros((4, 4, 4), dtype=np.uint8)
+    template = PngTemplate(base, 10)
+    assert template.rows == 4
+    prefix = np.full((4, 4, 4), 7, dtype=np.uint8)
+    assert np.array_equal(np.asarray(Image.open(io.BytesIO(template.encode(prefix)))), prefix)
+
+
+@pytest.mark.parametrize("size", [17, 60, 400])
+def test_sign_documents_outputs_verify(generator, tmp_path, size):
+    paths = []
+    for i in range(3):
+        paths.append(tmp_path / f"{i}.txt")
+        paths[-1].write_bytes(bytes([i]) * (i * 1000 + 1))
+    results = list(sign_documents(generator, "ACME", "1", [str(p) for p in paths], size=size, workers=1))
+    for path, result in zip(paths, results):
+        assert result["error"] is None
+        output = tmp_path / (result["document"] + ".png")
+        output.write_bytes(result["data"])
+        verified = verify_seal_file(str(output))
+        assert verified["status"] == "valid"
+        assert verified["data"]["file_size"] == path.stat().st_size
+
+
+# ---- 字形绘制与原实现的误差 ----
+
+def premultiplied(img):
+    arr = np.asarray(img).astype(np.float64)
+    return np.concatenate([arr[..., :3] * arr[..., 3:] / 255, arr[..., 3:]], axis=-1)
+
+
+@pytest.mark.parametrize("size", [200, 300])
+def test_seal_matches_legacy_rendering(size):
+    """
+        超采样图块绘制与原整图绘制的整章（模糊后）差异：99.9%的像素误差约8/255
+        原实现的横向压缩取整会带来与尺寸有关的亚像素偏移，因此只比较提交时核对过的尺寸
+    """
+    stamp = SealGenerator.make_stamp("ACME TRADING CO", "1234567890", size)
+    expected = stamp.draw_frame()
+    for xy, angle, r, word, font_size, font_xratio, stroke_width, font_flip in stamp.layout():
+        legacy_draw_rotated_text(expected, angle, xy, r, word, stamp.fill, font_size, font_xratio, stroke_width,
+                                 font_flip)
+    expected = expected.filter(ImageFilter.GaussianBlur(stamp.blur_radius))
+    stamp.draw_stamp()
+
+    diff = np.abs(premultiplied(stamp.img) - premultiplied(expected))
+    assert np.percentile(diff, 99.9) <= 10
+    assert diff.max() <= 32
@@ -0,0 +1,44 @@
+# 批量验证印章命令行工具
+#
+# 用法：
+#   python verify.py seals_dir
+#   python verify.py seals.zip -o results.jsonl --workers 8
+#
+# 输入为目录（递归查找图片）或zip文件，每张图片输出一行JSON：
+#   file    图片在目录或zip中的相对路径
+#   status  valid 签名有效 / invalid 签名无效 / corrupt 水印或图片损坏 / no_watermark 未检测到水印
+#   data    水印中的数据（issuer、file_hash等）
+#   error   错误信息
+import argparse
+import json
+import sys
+from collections import Counter
+
+from seal_core import verify_seals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量验证红章")
+    parser.add_argument("source", help="印章图片目录或zip文件")
+    parser.add_argument("-o", "--output", help="结果JSONL文件，默认输出到标准输出")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="进程数，默认CPU核数")
+    parser.add_argument("--unordered", action="store_true", help="按完成先后输出，不保持输入顺序")
+    args = parser.parse_args(argv)
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    counts = Counter()
+    try:
+        for result in verify_seals(args.source, workers=args.workers, ordered=not args.unordered):
+            counts[result["status"]] += 1
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    summary = "，".join(f"{status} {count}" for status, count in sorted(counts.items()))
+    print(f"完成：{summary or '没有找到图片'}", file=sys.stderr)
+    return 0 if counts and set(counts) == {"valid"} else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())